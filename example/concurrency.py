@@ -1,6 +1,6 @@
 import concurrent.futures #https://docs.python.org/3/library/concurrent.futures.html#module-concurrent.futures
 
-from amara3.uxml import tree
+from amara3.uxml import tree, treeiter, bulk
 from amara3.uxml.treeutil import *
 
 #></link>
@@ -62,8 +62,8 @@ def main():
     root = tb.parse(MICRODOC)
     print('Processes\n')
     with concurrent.futures.ProcessPoolExecutor() as executor:
-        #for markdown in executor.map(summarize, select_pattern(root, ('description',))):
-        for markdown in executor.map(md_summary, select_name(root, 'description')):
+        #Elements can't be pickled as they are (parent links are weak references), so dispatch ships them serialized
+        for markdown in bulk.dispatch(select_name(root, 'description'), md_summary, executor):
             print(markdown)
     print()
 
@@ -72,6 +72,15 @@ def main():
         #for markdown in executor.map(summarize, select_pattern(root, ('description',))):
         for markdown in executor.map(md_summary, select_name(root, 'description')):
             print(markdown)
+    print()
+
+    #Without building the whole tree first: subtrees are dispatched as they're parsed,
+    #and the summaries come back in document order
+    print('Streaming, processes\n')
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        descriptions = treeiter.iterparse(MICRODOC, ('descriptionSet', 'description'))
+        for markdown in bulk.dispatch(descriptions, md_summary, executor):
+            print(markdown)
 
 
 if __name__ == '__main__':
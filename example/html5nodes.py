@@ -0,0 +1,99 @@
+'''
+Benchmark memory & speed of parsing a corpus of HTML pages and holding the trees in memory
+
+python example/html5nodes.py [DIRECTORY_OF_HTML_FILES]
+
+Without a directory, a synthetic corpus of pages is generated. For comparison, the same corpus
+is also parsed with html5lib's own ElementTree builder, and the resulting trees are re-parsed as XML
+into plain amara3 trees, which share the element layout (tree.element slots) of HTML trees
+'''
+
+import io
+import os
+import sys
+import glob
+import time
+import tracemalloc
+
+import html5lib
+
+from amara3.uxml import html5, tree, xml
+
+PAGE = '''\
+<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Page {0}</title>
+<link rel="stylesheet" href="/style.css">
+</head>
+<body class="page">
+<nav><ul>{1}</ul></nav>
+<div id="main">
+{2}
+<table class="data"><tr><th>Key<th>Value{3}</table>
+</div>
+<footer><p>Page {0} &copy; 2024</footer>
+</body>
+</html>
+'''
+
+
+def synthetic_page(i):
+    nav = ''.join('<li><a href="/section/{0}">Section {0}</a>'.format(j) for j in range(10))
+    paras = '\n'.join('<h2>Heading {0}</h2><p>Some <b>bold</b> and <i>italic</i> text, with a <a href="/p/{0}">link</a>.<p>More text {1}'.format(j, i) for j in range(20))
+    rows = ''.join('<tr><td>k{0}<td>v{1}'.format(j, i) for j in range(30))
+    return PAGE.format(i, nav, paras, rows)
+
+
+def load_corpus(directory=None, count=200):
+    if directory:
+        pages = []
+        for fname in sorted(glob.glob(os.path.join(directory, '**', '*.htm*'), recursive=True)):
+            with open(fname, 'rb') as fp:
+                pages.append(fp.read())
+        return pages
+    return [ synthetic_page(i).encode('utf-8') for i in range(count) ]
+
+
+def count_elements(root):
+    count = 0
+    to_visit = [root]
+    while to_visit:
+        node = to_visit.pop()
+        if isinstance(node, tree.element):
+            count += 1
+            to_visit.extend(node.xml_children)
+    return count
+
+
+def measure(label, parse, pages):
+    '''
+    Parse all pages, keeping the results, and report time taken & memory retained
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [ parse(page) for page in pages ]
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{0:<20} {1:>8.1f} ms/page {2:>10.1f} KiB retained/page {3:>10.1f} KiB peak'.format(
+        label, 1000 * elapsed / len(pages), retained / 1024 / len(pages), peak / 1024))
+    return kept
+
+
+def main(directory=None):
+    pages = load_corpus(directory)
+    print('{0} pages'.format(len(pages)))
+    kept = measure('amara3 html5', lambda page: html5.parse(io.BytesIO(page)), pages)
+    elements = sum(count_elements(root) for root in kept)
+    print('{0} elements, {1:.1f} elements/page'.format(elements, elements / len(pages)))
+    xml_pages = [ root.xml_encode() for root in kept ]
+    del kept
+    measure('amara3 xml', lambda page: xml.treebuilder().parse(page), xml_pages)
+    measure('html5lib etree', lambda page: html5lib.parse(io.BytesIO(page), treebuilder='etree'), pages)
+    return
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
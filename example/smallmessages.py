@@ -0,0 +1,65 @@
+'''
+Benchmark parsing many small XML messages, one builder per message versus
+reusing one builder through parse_many, for both the regular & direct expat tree builders
+
+python example/smallmessages.py
+'''
+
+import gc
+import time
+
+from amara3.uxml import xml
+
+MESSAGE = '''\
+<message xmlns="urn:example:messages" id="{0}">
+  <header><from>sensor-{1}</from><to>collector</to><sent>2013-06-{2:02}T12:00:00</sent></header>
+  <body>
+    <reading kind="temperature" unit="C">{3}</reading>
+    <reading kind="humidity" unit="%">{4}</reading>
+    <status>ok</status>
+  </body>
+</message>
+'''
+
+COUNT = 20000
+REPEAT = 3
+
+
+def messages(count=COUNT):
+    return [ MESSAGE.format(i, i % 50, i % 28 + 1, i % 40, i % 100) for i in range(count) ]
+
+
+def one_builder_each(docs):
+    return [ xml.treebuilder().parse(doc) for doc in docs ]
+
+
+def reused_builder(docs):
+    return list(xml.treebuilder().parse_many(docs))
+
+
+def direct_builder_each(docs):
+    return [ xml.directtreebuilder().parse(doc) for doc in docs ]
+
+
+def reused_direct_builder(docs):
+    return list(xml.directtreebuilder().parse_many(docs))
+
+
+def main():
+    docs = messages()
+    print('{0} messages of about {1} bytes each\n'.format(len(docs), len(docs[0])))
+    for func in (one_builder_each, reused_builder, direct_builder_each, reused_direct_builder):
+        timings = []
+        for i in range(REPEAT):
+            gc.collect()
+            start = time.perf_counter()
+            roots = func(docs)
+            timings.append(time.perf_counter() - start)
+            assert len(roots) == len(docs)
+            del roots
+        elapsed = min(timings)
+        print('{0:24} {1:.3f}s ({2:.1f} µs per message)'.format(func.__name__, elapsed, elapsed / len(docs) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
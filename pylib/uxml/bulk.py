@@ -0,0 +1,221 @@
+# -----------------------------------------------------------------------------
+# amara3.uxml.bulk
+#
+# Parsing large numbers of files across a pool of processes
+#
+# -----------------------------------------------------------------------------
+
+'''
+Parse many XML or MicroXML files in parallel, using a process pool,
+or process streamed subtrees in parallel, using any executor
+
+>>> import glob
+>>> from amara3.uxml import bulk
+>>> for path, root in bulk.parse_many(glob.glob('data/**/*.xml', recursive=True), workers=4):
+...     print(path, root.xml_name)
+
+Trees can't be pickled as they are (parent links are weak references), and deep pickles
+would be slow anyway, so each tree travels back from the workers flattened by dumps(),
+then rebuilt by loads(). Better still, pass a function to be applied to each tree in the
+worker, so that only its (picklable) result travels back.
+'''
+
+import os
+import marshal
+import weakref
+import itertools
+import collections
+import concurrent.futures
+
+from . import tree, xml
+
+DEFAULT_BATCH_SIZE = 16
+
+
+def dumps(elem):
+    '''
+    Serialize a tree to a compact bytes form
+
+    The tree is flattened in document order: each element becomes a (name, attributes, child count)
+    tuple and each text node a plain string, then the whole list is marshaled
+
+    >>> from amara3.uxml import tree, bulk
+    >>> bulk.loads(bulk.dumps(tree.parse('<a x="1"><b>c</b></a>'))).xml_encode()
+    '<a x="1"><b>c</b></a>'
+    '''
+    flat = []
+    to_visit = [elem]
+    while to_visit:
+        node = to_visit.pop()
+        if isinstance(node, tree.element):
+            flat.append((node.xml_name, dict(node.xml_attributes), len(node.xml_children)))
+            to_visit.extend(reversed(node.xml_children))
+        else:
+            flat.append(str(node))
+    return marshal.dumps(flat)
+
+
+def loads(data):
+    '''
+    Rebuild a tree serialized by dumps(), returning the root element
+    '''
+    flat = marshal.loads(data)
+    new_element, new_text, weakref_ = tree.element, tree.text, weakref.ref
+    root = None
+    #Stack of [element, children still to come]
+    open_elems = []
+    for item in flat:
+        if open_elems:
+            parent_entry = open_elems[-1]
+            parent = parent_entry[0]
+        else:
+            parent = None
+        if isinstance(item, tuple):
+            node = new_element(item[0], item[1])
+        else:
+            node = new_text(item)
+        if parent is None:
+            root = node
+        else:
+            node._xml_parent = weakref_(parent)
+            parent.xml_children.append(node)
+            parent_entry[1] -= 1
+            if not parent_entry[1]:
+                open_elems.pop()
+        if isinstance(item, tuple) and item[2]:
+            open_elems.append([node, item[2]])
+    return root
+
+
+def _parse_path(path, backend):
+    if backend == 'expat':
+        with open(path, 'rb') as fp:
+            return xml.directtreebuilder().parse(fp.read())
+    elif backend == 'microxml':
+        with open(path, encoding='utf-8') as fp:
+            return tree.treebuilder().parse(fp.read())
+    raise ValueError('Unknown parse backend: {0}'.format(repr(backend)))
+
+
+def _parse_batch(batch, backend, func, return_exceptions):
+    '''
+    Worker task: parse each of a batch of (index, path) pairs
+    Returns a list of (index, result, is_serialized_tree) tuples
+    '''
+    results = []
+    for ix, path in batch:
+        try:
+            root = _parse_path(path, backend)
+            if func is None:
+                results.append((ix, dumps(root), True))
+            else:
+                results.append((ix, func(root), False))
+        except Exception as e:
+            if not return_exceptions: raise
+            results.append((ix, e, False))
+    return results
+
+
+def _batches(paths, batch_size):
+    it = iter(enumerate(paths))
+    while True:
+        batch = list(itertools.islice(it, batch_size))
+        if not batch: break
+        yield batch
+
+
+def parse_many(paths, workers=None, backend='expat', func=None, ordered=True,
+                batch_size=DEFAULT_BATCH_SIZE, return_exceptions=False, window=None):
+    '''
+    Parse many files across a pool of processes, yielding (path, result) pairs
+
+    paths - iterable of file paths
+    workers - number of worker processes, defaulting to the CPU count. 0 means parse in this process
+    backend - 'expat' for XML 1.0 (reduced to MicroXML) or 'microxml' for the native MicroXML parser
+    func - function to be applied to each tree in the worker process, its result being sent back
+        instead of the tree. Must be picklable, e.g. defined at module level
+    ordered - if True yield in the order of paths, otherwise as results are completed
+    batch_size - number of files handled per task, to cut down on inter-process overhead
+    return_exceptions - if True an exception parsing a file is yielded as its result, rather than raised
+    window - maximum number of batches in flight, defaulting to twice the worker count.
+        Further batches are only submitted as results are consumed, so memory stays bounded
+    '''
+    paths = list(paths)
+    if workers == 0:
+        for batch in _batches(paths, batch_size):
+            for ix, result, serialized in _parse_batch(batch, backend, func, return_exceptions):
+                yield paths[ix], (loads(result) if serialized else result)
+        return
+
+    workers = workers or os.cpu_count()
+    if window is None:
+        window = 2 * workers
+    batches = _batches(paths, batch_size)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        try:
+            while True:
+                for batch in itertools.islice(batches, window - len(pending)):
+                    pending.append(executor.submit(_parse_batch, batch, backend, func, return_exceptions))
+                if not pending:
+                    break
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    future = done.pop()
+                    pending.remove(future)
+                for ix, result, serialized in future.result():
+                    yield paths[ix], (loads(result) if serialized else result)
+        finally:
+            #Abandoned early, or failed
+            for future in pending:
+                future.cancel()
+    return
+
+
+def _apply_serialized(func, data):
+    return func(loads(data))
+
+
+def dispatch(items, func, executor, window=None, serialize=None):
+    '''
+    Apply a function to each of a stream of items, e.g. subtrees from xmliter.iterparse,
+    in an executor, yielding results in the order of the items
+
+    Only up to window items are in flight at a time, and items are only drawn from the stream
+    to keep the window full, so memory stays bounded while results are consumed
+
+    >>> import concurrent.futures
+    >>> from amara3.uxml import bulk, xmliter
+    >>> with concurrent.futures.ProcessPoolExecutor() as executor, open('records.xml', 'rb') as fp:
+    ...     for summary in bulk.dispatch(xmliter.iterparse(fp, '//record'), summarize, executor):
+    ...         print(summary)
+
+    items - iterable of elements or other picklable values
+    func - function to be applied to each item. Must be picklable, for process pools
+    executor - concurrent.futures executor
+    window - maximum number of items in flight, defaulting to twice the executor's worker count
+    serialize - if True send elements to the executor flattened by dumps(), which is needed
+        for process pools (the default for ProcessPoolExecutor), since trees can't be pickled
+    '''
+    if window is None:
+        window = 2 * (getattr(executor, '_max_workers', None) or os.cpu_count())
+    if serialize is None:
+        serialize = isinstance(executor, concurrent.futures.ProcessPoolExecutor)
+    pending = collections.deque()
+    try:
+        for item in items:
+            if serialize and isinstance(item, tree.element):
+                pending.append(executor.submit(_apply_serialized, func, dumps(item)))
+            else:
+                pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        #Abandoned early, or failed
+        for future in pending:
+            future.cancel()
+    return
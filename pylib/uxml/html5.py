@@ -5,7 +5,7 @@
 """
 
 __all__ = [
-'node', 'treebuilder', 'comment', 'element',
+'node', 'treebuilder', 'comment', 'element', 'name_tuple',
 ]
 
 import copy
@@ -19,12 +19,18 @@ from .treeutil import *
 
 try:
     import html5lib
-    from html5lib.treebuilders.base import TreeBuilder, Node
+    from html5lib.treebuilders.base import TreeBuilder
 except ImportError:
     raise
 
 
-class node(Node):
+class node(object):
+    '''
+    Mixin implementing the node interface of html5lib's treebuilders.base.Node over amara3 trees
+
+    Node itself isn't a base class, since it would give every node an instance dict
+    '''
+    __slots__ = ()
     parent = tree.element.xml_parent
     value = tree.text.xml_value
 
@@ -54,57 +60,72 @@ class node(Node):
         """Return a shallow copy of the current node i.e. a node with the same
         name and attributes but with no parent or child nodes
         """
-        raise NotImplementedError
+        return self.xml_clone(deep=False)
 
     def hasContent(self):
         """Return true if the node has children or text, false otherwise
         """
         return bool(self.xml_children)
 
+    def reparentChildren(self, newParent):
+        """Move all the children of the current node to newParent.
+        This is needed so that trees that don't store text as nodes move the
+        text in the correct way
+        """
+        for child in self.childNodes:
+            newParent.appendChild(child)
+        self.childNodes = []
+
 
 def qname_to_local(qname):
     return qname.split(':')[-1]
 
 
+def name_tuple(namespace, name, table=None):
+    '''
+    Return the (namespace, name) tuple for an html5lib element name, shared through the given table dict if any.
+    Each treebuilder has its own table, so names from one parse don't outlive its trees
+
+    >>> from amara3.uxml import html5
+    >>> table = {}
+    >>> html5.name_tuple(None, 'p', table) is html5.name_tuple(None, 'p', table)
+    True
+    '''
+    key = (namespace, name)
+    if table is None:
+        return key
+    return table.setdefault(key, key)
+
+
 class element(tree.element, node):
     '''
     attributes - a dict holding name, value pairs for attributes of the node
     childNodes - a list of child nodes of the current node. This must
     include all elements but not necessarily other node types
-    _flags - A list of miscellaneous flags that can be set on the node
+    nameTuple - (namespace, name) as seen by html5lib, shared among the elements from one treebuilder (see name_tuple)
     '''
-    #name = nodes.element_base.xml_qname
-    #namespace = nodes.element_base.xml_namespace
-    #xml_exclude_pnames = frozenset(('name', 'parent', 'appendChild', 'removeChild', 'removeChild', 'value', 'attributes', 'childNodes'))
+    __slots__ = ('nameTuple',)
+
     @property
     def name(self):
-        return getattr(self, 'xml_html5lib_name', self.xml_name)
+        return self.nameTuple[1]
 
     @property
     def namespace(self):
-        return getattr(self, 'xml_html5lib_namespace', None)
-
-    @property
-    def nameTuple(self):
-        name = getattr(self, 'xml_html5lib_name', self.xml_name)
-        namespace = getattr(self, 'xml_html5lib_namespace', None)
-        return namespace, name
-        #return XHTML_NAMESPACE, self.xml_name
+        return self.nameTuple[0]
 
     def xml_get_childNodes_(self):
         return self.xml_children
 
     def xml_set_childNodes_(self, nodelist):
-        self.xml_children = []
-        for node in nodelist:
-            self.xml_append(node)
+        self.xml_replace_children(nodelist)
         return
 
     childNodes = property(xml_get_childNodes_, xml_set_childNodes_, None, "html5lib uses this property to manage HTML element children")
 
-    def __init__(self, name, attrs=None):
+    def __init__(self, name, attrs=None, nametuple=None):
         tree.element.__init__(self, name, attrs)
-        self._flags = []
+        self.nameTuple = nametuple or name_tuple(None, name)
         return
 
     def xml_set_attributes_(self, attrs):
@@ -126,8 +147,10 @@ class element(tree.element, node):
         """Return a shallow copy of the current node i.e. a node with the same
         name and attributes but with no parent or child nodes
         """
-        attrs = self.xml_attributes.copy()
-        return element(self.xml_name, attrs=attrs)
+        clone = self.xml_clone(deep=False)
+        #html5lib relies on nameTuple of clones in its adoption agency algorithm
+        clone.nameTuple = self.nameTuple
+        return clone
 
 
 #class comment(tree.comment):
@@ -191,30 +214,24 @@ class treebuilder(TreeBuilder):
         #html5lib.treebuilders._base.TreeBuilder breaks if you do not pass in True for namespaceHTMLElements
         #We'll take care of that ourselves with the if not use_xhtml_ns... below
         TreeBuilder.__init__(self, True)
+        #(namespace, name) pairs as html5lib sees them, shared by all elements with the same pair
+        names = self.name_tuples = {}
         def eclass(name, namespace):
-            xml_html5lib_name, xml_html5lib_namespace = MARKER, MARKER
+            html5lib_namespace = None
             if not use_xhtml_ns and namespace == XHTML_NAMESPACE:
                 #html5lib feints support for HTML5 elements kept in the null namespace
                 #But in reality this support is broken.  We have to in effect keep
                 #Two namespaces for each element, the real one from an amara perspective
                 #And another that is always XHTML for HTML5 elements, so html5lib doesn't break
-                xml_html5lib_namespace = namespace
-                namespace = None
+                html5lib_namespace = namespace
             #For some reason html5lib sometimes sends None as name
             if not name:
-                xml_html5lib_name = name
-                name = NAME_FOR_ELEMENTS_UNNAMED_BY_HTML5LIB
-            #import sys; print >> sys.stderr, (namespace, name, use_xhtml_ns)
-            #Deal with some broken HTML that uses bogus colons in tag names
-            if (u":" in name and not namespace):
-                xml_html5lib_namespace = namespace
-                namespace = BOGUS_NAMESPACE
-            elem = element(qname_to_local(name))
-            if xml_html5lib_namespace != MARKER:
-                elem.xml_html5lib_namespace = xml_html5lib_namespace
-            if xml_html5lib_name != MARKER:
-                elem.xml_html5lib_name = xml_html5lib_name
-            return elem
+                local = NAME_FOR_ELEMENTS_UNNAMED_BY_HTML5LIB
+                return element(local, nametuple=name_tuple(html5lib_namespace, name, names))
+            #Broken HTML that uses bogus colons in tag names just gets the local part
+            #The element name is taken from the shared tuple, so it's held once for all elements of that name
+            nt = name_tuple(html5lib_namespace, qname_to_local(name), names)
+            return element(nt[1], nametuple=nt)
         self.elementClass = eclass
         self.fragmentClass = eclass
 
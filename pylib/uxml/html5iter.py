@@ -1,14 +1,309 @@
 ########################################################################
-# amara3.uxml.htmliter
+# amara3.uxml.html5iter
 """
+Streaming HTML, feeding treeiter patterns & sinks from html5lib's tokenizer,
+without building the whole document tree
 
+The tokens are turned into MicroXML events, with the more common tags implied by HTML
+filled in along the way: html, head & body (or frameset), the ends of void elements, of paragraphs
+interrupted by blocks & list items, of headings interrupted by headings, of links & buttons
+interrupted by others, and of list items, table cells & rows, options etc. left open,
+plus tbody & tr where table rows & cells are placed straight into a table.
+As in html5.parse, image is read as img, a newline right after a pre, listing or textarea start tag is dropped,
+table parts (cells, rows, captions etc.) outside any table are ignored, and in quirks mode
+(with no doctype, or one other than html) a table doesn't close an open paragraph.
+
+Limitations, compared with html5.parse:
+
+* Misnested markup is not reconstructed (there is no adoption agency algorithm),
+  so an end tag simply closes everything opened since its matching start tag, & stray end tags are ignored
+* Attributes of repeated html or body start tags are dropped rather than merged into the element,
+  whose start event has already been sent
+* A frameset start tag is only honoured before the body starts
+* Quirks mode isn't triggered by legacy doctype public identifiers, such as HTML 4.01 Transitional
+  without a system identifier, so those documents are parsed as if in no-quirks mode
 """
 
-from . import tree
+import collections
+
 from . import treeiter
-from .treeutil import *
+from .parser import event
 from . import html5
 
+from html5lib.constants import tokenTypes, voidElements
+try:
+    from html5lib._tokenizer import HTMLTokenizer
+except ImportError:
+    from html5lib.tokenizer import HTMLTokenizer
+
+
+START_TAG = tokenTypes['StartTag']
+EMPTY_TAG = tokenTypes['EmptyTag']
+END_TAG = tokenTypes['EndTag']
+CHARACTERS = tokenTypes['Characters']
+SPACE_CHARACTERS = tokenTypes['SpaceCharacters']
+DOCTYPE = tokenTypes['Doctype']
+
+VOID_ELEMENTS = frozenset(voidElements) | frozenset(('keygen', 'menuitem', 'wbr'))
+
+#Elements which belong in head, if encountered before any body content
+HEAD_ELEMENTS = frozenset(('base', 'basefont', 'bgsound', 'link', 'meta', 'noframes',
+    'noscript', 'script', 'style', 'template', 'title'))
+
+#Start tags which close an open p
+CLOSES_P = frozenset(('address', 'article', 'aside', 'blockquote', 'center', 'details', 'dialog',
+    'dir', 'div', 'dl', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'header', 'hgroup', 'hr', 'listing', 'main', 'menu', 'nav', 'ol', 'p',
+    'plaintext', 'pre', 'section', 'summary', 'table', 'ul', 'xmp', 'li', 'dd', 'dt'))
+
+HEADINGS = frozenset(('h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+
+#Start tags after which a leading newline is dropped
+DROPS_NEWLINE = frozenset(('pre', 'listing', 'textarea'))
+
+#Start tags ignored outside of tables
+TABLE_PARTS = frozenset(('caption', 'col', 'colgroup', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr'))
+
+#Elements which bound the search for open elements to be implicitly closed
+SCOPE_ELEMENTS = frozenset(('applet', 'button', 'caption', 'html', 'body', 'marquee', 'object',
+    'table', 'td', 'th', 'template', 'svg', 'math'))
+
+#Start tag -> (open elements it implicitly closes, further elements bounding the search for them)
+IMPLIED_ENDS = {
+    'li': (('li',), ('ol', 'ul')),
+    'dt': (('dt', 'dd'), ('dl',)),
+    'dd': (('dt', 'dd'), ('dl',)),
+    'option': (('option',), ('select', 'datalist')),
+    'optgroup': (('optgroup', 'option'), ('select',)),
+    'tr': (('tr', 'td', 'th'), ('tbody', 'thead', 'tfoot')),
+    'td': (('td', 'th'), ('tr',)),
+    'th': (('td', 'th'), ('tr',)),
+    'thead': (('thead', 'tbody', 'tfoot', 'tr', 'td', 'th'), ()),
+    'tbody': (('thead', 'tbody', 'tfoot', 'tr', 'td', 'th'), ()),
+    'tfoot': (('thead', 'tbody', 'tfoot', 'tr', 'td', 'th'), ()),
+    #A nested link or button closes the open one
+    'a': (('a',), ()),
+    'button': (('button',), ()),
+}
+
+#Start tag -> element implied if it's placed straight into one of the given parents
+IMPLIED_PARENTS = {
+    'tr': ('tbody', ('table',)),
+    'td': ('tr', ('table', 'tbody', 'thead', 'tfoot')),
+    'th': ('tr', ('table', 'tbody', 'thead', 'tfoot')),
+}
+
+RCDATA_ELEMENTS = frozenset(('title', 'textarea'))
+RAWTEXT_ELEMENTS = frozenset(('style', 'xmp', 'iframe', 'noembed', 'noframes'))
+
+
+def _local_attrs(data):
+    if isinstance(data, list):
+        #Older html5lib: list of pairs, where the first of any duplicates wins
+        pairs, data = data, {}
+        for name, value in pairs:
+            data.setdefault(name, value)
+    return { html5.qname_to_local(name): value for name, value in data.items() }
+
+
+def events(source):
+    '''
+    Generate MicroXML events from HTML
+
+    source - HTML text or bytes, or a file-like object, which is read incrementally
+
+    >>> from amara3.uxml import html5iter
+    >>> [ ev[1] for ev in html5iter.events('<title>x</title><p>1<p>2') if ev[0] == html5iter.event.start_element ]
+    ['html', 'head', 'title', 'body', 'p', 'p']
+    '''
+    tokenizer = HTMLTokenizer(source)
+    stack = []
+    #Which of the implied html, head & body have been started: None, 'html', 'head', 'after_head', 'body' or 'frameset'
+    phase = None
+    #True right after a start tag whose leading newline is dropped
+    drop_newline = False
+    #Quirks mode, determined by the doctype, or its absence, before any content. None until then
+    quirks = None
+
+    def start(name, attrs):
+        ev = (event.start_element, name, attrs, stack.copy())
+        stack.append(name)
+        return ev
+
+    def end():
+        name = stack.pop()
+        return (event.end_element, name, stack.copy())
+
+    def close_through(index):
+        #End the open elements from the top of the stack down to & including the one at index
+        while len(stack) > index:
+            yield end()
+
+    def find_open(names, bounds):
+        #Index of the outermost of a run of open elements with the given names, within the bounds
+        found = None
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] in names:
+                found = i
+            elif stack[i] in bounds or stack[i] in SCOPE_ELEMENTS:
+                break
+        return found
+
+    for token in tokenizer:
+        ttype = token['type']
+        if ttype in (START_TAG, EMPTY_TAG, END_TAG):
+            name = token['name']
+        elif ttype == SPACE_CHARACTERS:
+            #Leading whitespace is dropped, as by html5lib's tree construction
+            if phase in (None, 'html'):
+                continue
+        elif ttype == DOCTYPE:
+            if quirks is None:
+                quirks = not token['correct'] or token['name'] != 'html'
+            continue
+        elif ttype != CHARACTERS:
+            #Comments & parse errors
+            continue
+        if quirks is None:
+            quirks = True
+        if drop_newline:
+            drop_newline = False
+            if ttype in (CHARACTERS, SPACE_CHARACTERS) and token['data'].startswith('\n'):
+                token = dict(token, data=token['data'][1:])
+                if not token['data']:
+                    continue
+
+        #Fill in any implied html, head & body. End tags before the body are mostly ignored
+        is_start = ttype in (START_TAG, EMPTY_TAG)
+        if phase is None:
+            if ttype == END_TAG:
+                continue
+            phase = 'html'
+            if is_start and name == 'html':
+                yield start('html', _local_attrs(token['data']))
+                continue
+            yield start('html', {})
+        if phase == 'html':
+            if is_start and name == 'head':
+                yield start('head', _local_attrs(token['data']))
+                phase = 'head'
+                continue
+            if ttype == END_TAG and name not in ('head', 'body', 'html', 'br'):
+                continue
+            yield start('head', {})
+            phase = 'head'
+        if phase == 'head':
+            if ttype == END_TAG and name == 'head':
+                yield from close_through(stack.index('head'))
+                phase = 'after_head'
+                continue
+            #Head elements, whitespace, and the content & end tags of elements within head stay in head
+            in_head_child = stack[-1] != 'head'
+            if not ((is_start and name in HEAD_ELEMENTS) or ttype == SPACE_CHARACTERS
+                    or (in_head_child and ttype in (CHARACTERS, END_TAG))):
+                yield from close_through(stack.index('head'))
+                phase = 'after_head'
+        if phase == 'after_head':
+            if is_start and name == 'body':
+                yield start('body', _local_attrs(token['data']))
+                phase = 'body'
+                continue
+            if is_start and name == 'frameset':
+                yield start('frameset', _local_attrs(token['data']))
+                phase = 'frameset'
+                continue
+            if ttype == END_TAG and name not in ('body', 'html', 'br'):
+                continue
+            if ttype != SPACE_CHARACTERS:
+                yield start('body', {})
+                phase = 'body'
+        if phase == 'frameset':
+            #Only frames, nested framesets & noframes, & whitespace, are allowed
+            if is_start and name in ('frameset', 'frame', 'noframes'):
+                yield start(name, _local_attrs(token['data']))
+                if name == 'frame':
+                    yield end()
+                elif name == 'noframes':
+                    tokenizer.state = tokenizer.rawtextState
+            elif ttype == END_TAG and name in ('frameset', 'noframes') and name in stack:
+                yield from close_through(len(stack) - 1 - stack[::-1].index(name))
+            elif ttype == SPACE_CHARACTERS or (ttype == CHARACTERS and stack[-1] == 'noframes'):
+                yield (event.characters, token['data'])
+            continue
+
+        if ttype in (CHARACTERS, SPACE_CHARACTERS):
+            yield (event.characters, token['data'])
+
+        elif ttype in (START_TAG, EMPTY_TAG):
+            if name == 'html' and stack:
+                #Repeated html start tags are ignored, as are body start tags once in body
+                continue
+            if name in ('body', 'frameset') and phase == 'body':
+                continue
+            foreign = 'svg' in stack or 'math' in stack
+            if name == 'image' and not foreign:
+                name = 'img'
+            if name in TABLE_PARTS and 'table' not in stack:
+                continue
+            if name in CLOSES_P and not (name == 'table' and quirks):
+                p_index = find_open(('p',), ())
+                if p_index is not None:
+                    yield from close_through(p_index)
+            if name in HEADINGS and stack[-1] in HEADINGS:
+                yield end()
+            implied = IMPLIED_ENDS.get(name)
+            if implied:
+                index = find_open(*implied)
+                if index is not None:
+                    yield from close_through(index)
+            implied = IMPLIED_PARENTS.get(name)
+            if implied and stack and stack[-1] in implied[1]:
+                parent = implied[0]
+                if parent == 'tr' and stack[-1] == 'table':
+                    yield start('tbody', {})
+                yield start(parent, {})
+            yield start(name, _local_attrs(token['data']))
+            drop_newline = name in DROPS_NEWLINE
+            if name in VOID_ELEMENTS or ((foreign or name in ('svg', 'math')) and token.get('selfClosing')):
+                yield end()
+            elif name in RCDATA_ELEMENTS:
+                tokenizer.state = tokenizer.rcdataState
+            elif name in RAWTEXT_ELEMENTS:
+                tokenizer.state = tokenizer.rawtextState
+            elif name == 'script':
+                tokenizer.state = tokenizer.scriptDataState
+            elif name == 'plaintext':
+                tokenizer.state = tokenizer.plaintextState
+
+        elif ttype == END_TAG:
+            if name in ('body', 'html'):
+                #Any content after these still goes in the body, so they're closed at the end
+                continue
+            if name in stack:
+                yield from close_through(len(stack) - 1 - stack[::-1].index(name))
+            elif name == 'p':
+                #Stray </p> gives an empty paragraph
+                yield start('p', {})
+                yield end()
+            elif name == 'br':
+                yield start('br', {})
+                yield end()
+
+    if phase is None:
+        yield start('html', {})
+        phase = 'html'
+    if phase == 'html':
+        yield start('head', {})
+        yield end()
+        phase = 'after_head'
+    if phase == 'head':
+        yield from close_through(stack.index('head'))
+        phase = 'after_head'
+    if phase == 'after_head':
+        yield start('body', {})
+    yield from close_through(0)
+    return
+
 
 class sender(treeiter.sender):
     '''
@@ -20,14 +315,41 @@ class sender(treeiter.sender):
     ...
     >>> values = []
     >>> ts = html5iter.sender(('html', 'body', 'ul', 'li'), sink(values))
-    >>> ts.parse('<html><head><title></head><body><ul><li>1</li><li>2</li><li>3</li></ul></body>')
+    >>> ts.parse('<html><head><title>x</title></head><body><ul><li>1<li>2<li>3</ul></body>')
     >>> values
     ['1', '2', '3']
     '''
-    def parse(self, doc):
+    def parse(self, source):
+        '''
+        Parse HTML from text or bytes, or a file-like object, which is read incrementally
+        '''
         h = self._handler()
-        p = html5.parser(h)
-        p.send((doc, False))
-        p.send(('', True))  # Wrap it up
+        next(h)
+        for ev in events(source):
+            h.send(ev)
         return
 
+
+def iterparse(source, pattern, projection=None, fields=None):
+    '''
+    Parse HTML, yielding each subtree matching the pattern as soon as its end is seen
+
+    source - HTML text or bytes, or a file-like object, which is read incrementally
+    pattern, projection, fields - as for treeiter.iterparse
+
+    >>> from amara3.uxml import html5iter
+    >>> [ e.xml_attributes['href'] for e in html5iter.iterparse('<p><a href="x">1</a><p><a href="y">2</a>', '//a') ]
+    ['x', 'y']
+    '''
+    if isinstance(pattern, str):
+        from .uxpath import compile_pattern
+        pattern = compile_pattern(pattern)
+    matches = collections.deque()
+    ts = sender(pattern, treeiter._collector(matches), projections=projection, fields=fields)
+    h = ts._handler()
+    next(h)
+    for ev in events(source):
+        h.send(ev)
+        while matches:
+            yield matches.popleft()
+    return
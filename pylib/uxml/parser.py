@@ -136,7 +136,13 @@ def error_context(window, start, end, size=10):
 
 
 @coroutine
-def parser(handler, strict=True):
+def parser(handler, strict=True, multidoc=False):
+    '''
+    Coroutine which parses MicroXML text fragments sent as (fragment, done) tuples, sending events to handler
+
+    multidoc - if True accept a stream of concatenated documents rather than reporting junk after
+        the first document element. Each new document starts with a start_element event having an empty element stack
+    '''
     next(handler) #Prime the coroutine
     #abspos = 0
     line_count = 1
@@ -324,6 +330,12 @@ def parser(handler, strict=True):
                         #    continue
                         if pos == wlen:
                             break
+                        elif multidoc:
+                            #Another document follows. Discard the window up to here, so a long stream doesn't accumulate
+                            window = window[pos:]
+                            wlen = len(window)
+                            pos = 0
+                            curr_state = state.pre_element
                         else:
                             raise RuntimeError('Junk after document element')
                     #print('END1')
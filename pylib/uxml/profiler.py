@@ -0,0 +1,220 @@
+# -----------------------------------------------------------------------------
+# amara3.uxml.profiler
+#
+# Single-pass profiling of document shape from parse events
+#
+# -----------------------------------------------------------------------------
+
+'''
+Profile the shape of a document in one pass over its parse events, without building a tree:
+which element paths occur & how often, depths, text sizes and attribute cardinalities
+
+>>> from amara3.uxml import profiler
+>>> prof = profiler.profiler()
+>>> with open('feed.xml', 'rb') as fp:
+...     prof.parse(fp)
+...
+>>> report = prof.report()
+>>> report['paths']['/feed/entry']['count']
+5000
+
+Memory use is bounded by the caps on distinct paths, element names & attributes tracked
+(max_paths, max_names, max_attributes), not by the size of the document. Occurrences beyond
+those caps are only counted in the untracked_* totals. Distinct attribute values are counted
+exactly up to the sketch size, and estimated beyond that
+'''
+
+import heapq
+import collections
+
+from .parser import parser, event
+from . import xml
+
+DEFAULT_MAX_PATHS = 10000
+DEFAULT_MAX_NAMES = 10000
+DEFAULT_MAX_ATTRIBUTES = 10000
+DEFAULT_SKETCH_SIZE = 256
+
+#Hashes are taken as unsigned 64 bit values, & scaled to [0, 1) for estimation
+_HASH_MASK = (1 << 64) - 1
+_HASH_RANGE = float(1 << 64)
+
+
+class sketch(object):
+    '''
+    K minimum values sketch, for estimating the number of distinct values in a stream in bounded memory
+
+    >>> from amara3.uxml.profiler import sketch
+    >>> s = sketch(k=64)
+    >>> for i in range(10000): s.add(str(i % 5000))
+    >>> 4000 < s.estimate() < 6000
+    True
+    '''
+    def __init__(self, k=DEFAULT_SKETCH_SIZE):
+        self.k = k
+        #Max-heap (by negation) of the k smallest hashes seen, plus a set of them for quick membership tests
+        self._heap = []
+        self._hashes = set()
+
+    def add(self, value):
+        h = hash(value) & _HASH_MASK
+        if h in self._hashes:
+            return
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, -h)
+            self._hashes.add(h)
+        elif h < -self._heap[0]:
+            evicted = -heapq.heapreplace(self._heap, -h)
+            self._hashes.discard(evicted)
+            self._hashes.add(h)
+        return
+
+    @property
+    def exact(self):
+        '''
+        True if the estimate is an exact count, i.e. there have been fewer than k distinct values
+        '''
+        return len(self._heap) < self.k
+
+    def estimate(self):
+        if self.exact:
+            return len(self._heap)
+        kth = -self._heap[0] / _HASH_RANGE
+        return int((self.k - 1) / kth)
+
+
+class _pathstats(object):
+    __slots__ = ('count', 'text_count', 'text_chars', 'text_max')
+
+    def __init__(self):
+        self.count = 0
+        self.text_count = 0
+        self.text_chars = 0
+        self.text_max = 0
+
+
+class _attrstats(object):
+    __slots__ = ('count', 'sketch')
+
+    def __init__(self, k):
+        self.count = 0
+        self.sketch = sketch(k)
+
+
+class profiler(object):
+    '''
+    Accumulates document shape statistics from parse events. Can be fed any number of documents
+    '''
+    def __init__(self, max_paths=DEFAULT_MAX_PATHS, sketch_size=DEFAULT_SKETCH_SIZE,
+                    max_names=DEFAULT_MAX_NAMES, max_attributes=DEFAULT_MAX_ATTRIBUTES):
+        '''
+        max_paths - maximum number of distinct element paths to be tracked individually.
+            Elements on further paths are only counted in the overall figures
+        sketch_size - number of values kept by each attribute's sketch of distinct values
+        max_names - maximum number of distinct element names to be counted individually
+        max_attributes - maximum number of distinct path/attribute name pairs to be tracked
+        '''
+        self.max_paths = max_paths
+        self.sketch_size = sketch_size
+        self.max_names = max_names
+        self.max_attributes = max_attributes
+        self.documents = 0
+        self.elements = 0
+        self.untracked = 0
+        self.untracked_names = 0
+        self.untracked_attributes = 0
+        self.max_depth = 0
+        self.depths = collections.Counter()
+        self.names = collections.Counter()
+        self.paths = {}
+        self.attributes = {}
+
+    def handler(self):
+        '''
+        Coroutine to be sent parse events, e.g. via xml.parse or parser.parser
+        '''
+        paths, attributes, names = self.paths, self.attributes, self.names
+        #For each open element, [path, stats (None if untracked), text length]
+        stack = []
+        while True:
+            ev = yield
+            if ev[0] == event.start_element:
+                name = ev[1]
+                if stack:
+                    path = stack[-1][0] + '/' + name
+                else:
+                    path = '/' + name
+                    self.documents += 1
+                depth = len(stack) + 1
+                self.elements += 1
+                if name in names or len(names) < self.max_names:
+                    names[name] += 1
+                else:
+                    self.untracked_names += 1
+                self.depths[depth] += 1
+                if depth > self.max_depth: self.max_depth = depth
+                stats = paths.get(path)
+                if stats is None and len(paths) < self.max_paths:
+                    stats = paths[path] = _pathstats()
+                if stats is None:
+                    self.untracked += 1
+                else:
+                    stats.count += 1
+                    for aname, aval in ev[2].items():
+                        akey = path + '/@' + aname
+                        astats = attributes.get(akey)
+                        if astats is None:
+                            if len(attributes) >= self.max_attributes:
+                                self.untracked_attributes += 1
+                                continue
+                            astats = attributes[akey] = _attrstats(self.sketch_size)
+                        astats.count += 1
+                        astats.sketch.add(aval)
+                stack.append([path, stats, 0])
+            elif ev[0] == event.characters:
+                if stack:
+                    stack[-1][2] += len(ev[1])
+            elif ev[0] == event.end_element:
+                path, stats, text_len = stack.pop()
+                if stats is not None and text_len:
+                    stats.text_count += 1
+                    stats.text_chars += text_len
+                    if text_len > stats.text_max: stats.text_max = text_len
+
+    def parse(self, source, chunk_size=xml.DEFAULT_CHUNK_SIZE):
+        '''
+        Profile XML from a string, a file-like object or an iterable of string or bytes chunks
+        '''
+        xml.parse(source, self.handler(), chunk_size=chunk_size)
+        return
+
+    def parse_microxml(self, frags):
+        '''
+        Profile MicroXML from text, or an iterable of text fragments
+        '''
+        p = parser(self.handler())
+        for frag in ([frags] if isinstance(frags, str) else frags):
+            p.send((frag, False))
+        p.send(('', True))
+        return
+
+    def report(self):
+        '''
+        Return the statistics so far as a dict
+        '''
+        return {
+            'documents': self.documents,
+            'elements': self.elements,
+            'max_depth': self.max_depth,
+            'depths': dict(sorted(self.depths.items())),
+            'names': dict(self.names.most_common()),
+            'untracked_elements': self.untracked,
+            'untracked_names': self.untracked_names,
+            'untracked_attributes': self.untracked_attributes,
+            'paths': { path: {'count': s.count, 'text_count': s.text_count,
+                                'text_chars': s.text_chars, 'text_max': s.text_max}
+                        for path, s in self.paths.items() },
+            'attributes': { akey: {'count': a.count, 'distinct': a.sketch.estimate(),
+                                    'distinct_exact': a.sketch.exact}
+                            for akey, a in self.attributes.items() },
+        }
@@ -17,6 +17,11 @@ from amara3.uxml.parser import parse, parser, parsefrags, event
 
 
 class node(object):
+    #Storage is declared by subclasses: slots for elements, an instance dict for text (str subclasses can't have slots)
+    __slots__ = ()
+    #Cached structural hash; see amara3.uxml.treeutil.subtree_hash
+    _xml_hash = None
+
     def __init__(self, parent=None):
         self._xml_parent = weakref.ref(parent) if parent is not None else None
         #self._xml_parent = weakref.ref(parent or NO_PARENT)
@@ -33,15 +38,56 @@ class node(object):
     def xml_write(self, fp):
         fp.write(self.xml_encode())
 
+    def xml_invalidate(self):
+        '''
+        Discard cached data derived from this node's subtree, such as structural hashes, up through its ancestors
+
+        Called by the xml_ mutation methods. Call it yourself after modifying xml_children or xml_attributes directly
+        '''
+        node = self
+        #A cached ancestor implies cached descendants, so stop at the first uncached node
+        while node is not None and node._xml_hash is not None:
+            node._xml_hash = None
+            node = node.xml_parent
+        return
+
+    def xml_detach(self):
+        '''
+        Remove this node from its parent, if any, and return it
+
+        Matches by identity, so equal text nodes elsewhere among the siblings are left alone
+        '''
+        parent = self.xml_parent
+        if parent is not None:
+            parent.xml_invalidate()
+            siblings = parent.xml_children
+            for ix, sibling in enumerate(siblings):
+                if sibling is self:
+                    del siblings[ix]
+                    break
+        self._xml_parent = None
+        return self
+
 
 class element(node):
     '''
     Note: Meant to be bare bones & Pythonic. Does no integrity checking of direct manipulations, such as adding an integer to xml_children, or '1' as an attribute name
     '''
+    #Fixed slots, since large trees hold very many elements. The __dict__ slot still allows occasional
+    #extra attributes (e.g. xml_namespaces on roots), but is only allocated once one is set
+    #xml_nsid & xml_attr_nsids are namespace information, only set when parsed in namespace-preserving mode
+    #(see amara3.uxml.xml.nstable): id of the element's namespace, 0 for none, and a dict from attribute name
+    #to namespace id, for namespaced attributes only
+    __slots__ = ('xml_name', 'xml_attributes', 'xml_children', '_xml_parent', '_xml_hash',
+                'xml_nsid', 'xml_attr_nsids', '__weakref__', '__dict__')
+
     def __init__(self, name, attrs=None, parent=None):#, ancestors=None):
         self.xml_name = name
         self.xml_attributes = attrs or {}
         self.xml_children = []
+        self._xml_hash = None
+        self.xml_nsid = 0
+        self.xml_attr_nsids = None
         node.__init__(self, parent)
         return
 
@@ -98,12 +144,104 @@ class element(node):
             child = text(child, parent=self)
         else:
             child._xml_parent = weakref.ref(self)
+        self.xml_invalidate()
         if index == -1:
             self.xml_children.append(child)
         else:
             self.xml_children.insert(index, child)
         return
 
+    def _xml_adopt(self, children):
+        '''
+        Return a list of the given nodes reparented to self, all sharing one parent weakref
+
+        children - iterable of nodes. Strings are converted to text nodes, as in xml_insert
+        '''
+        parent_ref = weakref.ref(self)
+        adopted = []
+        for child in children:
+            if isinstance(child, str):
+                child = text(child)
+            child._xml_parent = parent_ref
+            adopted.append(child)
+        return adopted
+
+    def xml_extend(self, children):
+        '''
+        Append a sequence of nodes as the last children, in one list operation
+
+        children - iterable of nodes to append. Strings are converted to text nodes, for convenience
+        '''
+        self.xml_children.extend(self._xml_adopt(children))
+        self.xml_invalidate()
+        return
+
+    def xml_replace_children(self, children):
+        '''
+        Replace all children of this element with the given sequence of nodes
+
+        children - iterable of nodes. Strings are converted to text nodes, for convenience
+        '''
+        #Adopt first, in case children is derived from the current child list
+        adopted = self._xml_adopt(children)
+        for child in self.xml_children:
+            if child._xml_parent is not None and child._xml_parent() is self:
+                child._xml_parent = None
+        self.xml_children = adopted
+        self.xml_invalidate()
+        return
+
+    def xml_remove_range(self, start, stop=None):
+        '''
+        Remove children in the slice start:stop, in one list operation
+
+        Returns the removed nodes, which are detached from this element
+        '''
+        removed = self.xml_children[start:stop]
+        del self.xml_children[start:stop]
+        self.xml_invalidate()
+        for child in removed:
+            child._xml_parent = None
+        return removed
+
+    def xml_clone(self, deep=True):
+        '''
+        Return a copy of this element, with no parent
+
+        deep - if True copy all descendants as well, otherwise copy only name and attributes
+
+        Names and attribute values are shared with the original, since strings are immutable.
+        Works iteratively, so arbitrarily deep trees are fine
+
+        >>> from amara3.uxml.tree import parse
+        >>> e = parse('<a x="1"><b>c</b></a>')
+        >>> e.xml_clone().xml_encode()
+        '<a x="1"><b>c</b></a>'
+        '''
+        cls = self.__class__
+        root_copy = cls(self.xml_name, self.xml_attributes.copy())
+        if self.xml_nsid or self.xml_attr_nsids:
+            root_copy.xml_nsid, root_copy.xml_attr_nsids = self.xml_nsid, self.xml_attr_nsids
+        if not deep:
+            return root_copy
+        to_copy = [(self, root_copy)]
+        while to_copy:
+            orig, copy = to_copy.pop()
+            parent_ref = weakref.ref(copy)
+            new_children = []
+            for child in orig.xml_children:
+                if isinstance(child, element):
+                    child_copy = child.__class__(child.xml_name, child.xml_attributes.copy())
+                    if child.xml_nsid or child.xml_attr_nsids:
+                        child_copy.xml_nsid, child_copy.xml_attr_nsids = child.xml_nsid, child.xml_attr_nsids
+                    to_copy.append((child, child_copy))
+                else:
+                    child_copy = text(child)
+                child_copy._xml_parent = parent_ref
+                new_children.append(child_copy)
+            copy.xml_children = new_children
+        return root_copy
+
     def __repr__(self):
         return u'{{uxml.element ({0}) "{1}" with {2} children}}'.format(hash(self), self.xml_name, len(self.xml_children))
 
@@ -125,6 +263,12 @@ class text(node, str):
     def xml_encode(self, indent=None, depth=0):
         return str(self)
 
+    def xml_clone(self, deep=True):
+        '''
+        Return a copy of this text node, with no parent
+        '''
+        return text(self)
+
     @property
     def xml_value(self):
         return str(self)
@@ -157,29 +301,90 @@ def strval(node, outermost=True):
     return accumulator
 
 
+class valuetable(object):
+    '''
+    Table of strings to be shared among the nodes of one or many documents, so that
+    repeated element names, attribute names and short attribute values are held only once
+
+    Pass the same instance to several tree builders to share across documents.
+    Text nodes are str subclass instances, each holding its own characters, so their values can't be shared this way.
+
+    >>> from amara3.uxml import tree
+    >>> values = tree.valuetable()
+    >>> a = tree.treebuilder(values=values).parse('<a status="ok"></a>')
+    >>> b = tree.treebuilder(values=values).parse('<b status="ok"></b>')
+    >>> a.xml_attributes['status'] is b.xml_attributes['status']
+    True
+    '''
+    def __init__(self, threshold=64):
+        '''
+        threshold - attribute values longer than this are not shared, being unlikely to repeat
+        '''
+        self.threshold = threshold
+        self._strings = {}
+
+    def name(self, name):
+        return self._strings.setdefault(name, name)
+
+    def value(self, value):
+        if len(value) > self.threshold:
+            return value
+        return self._strings.setdefault(value, value)
+
+    def attrs(self, attrs):
+        '''
+        Return a copy of the attribute dict with names and values drawn from the table
+        '''
+        setdefault = self._strings.setdefault
+        threshold = self.threshold
+        return { setdefault(k, k): (v if len(v) > threshold else setdefault(v, v)) for k, v in attrs.items() }
+
+    def clear(self):
+        self._strings.clear()
+
+    def __len__(self):
+        return len(self._strings)
+
+
 class treebuilder(object):
-    def __init__(self):
+    def __init__(self, values=None):
+        '''
+        values - optional valuetable for sharing names & attribute values, possibly with other builders
+        '''
         self._root = None
         self._parent = None
+        self._values = values
+        #List of finished roots, when parsing a stream of documents
+        self._completed = None
 
     @asyncio.coroutine
     def _handler(self):
+        values = self._values
         while True:
             ev = yield
             if ev[0] == event.start_element:
-                new_element = element(ev[1], ev[2], self._parent)
+                if values is not None:
+                    new_element = element(values.name(ev[1]), values.attrs(ev[2]), self._parent)
+                else:
+                    new_element = element(ev[1], ev[2], self._parent)
+                #Namespace info, from namespace-preserving XML parse
+                if len(ev) > 4:
+                    new_element.xml_nsid, new_element.xml_attr_nsids = ev[4]
                 #Note: not using weakrefs here because these refs are not circular
                 if self._parent: self._parent.xml_children.append(new_element)
-                self._parent = new_element
                 #Hold a reference to the top element of the subtree being built,
                 #or it will be garbage collected as the builder moves down the tree
-                if not self._root: self._root = new_element
+                #No parent means a new document, if parsing a stream of them
+                else: self._root = new_element
+                self._parent = new_element
             elif ev[0] == event.characters:
                 new_text = text(ev[1], self._parent)
                 if self._parent: self._parent.xml_children.append(new_text)
             elif ev[0] == event.end_element:
                 if self._parent:
                     self._parent = self._parent.xml_parent
+                    if self._parent is None and self._completed is not None:
+                        self._completed.append(self._root)
         return
 
     def parse(self, doc):
@@ -192,6 +397,32 @@ class treebuilder(object):
         p.send(('', True)) #Wrap it up
         return self._root
 
+    def parse_stream(self, frags):
+        '''
+        Parse a stream of concatenated MicroXML documents, yielding the root of each as soon as it's complete
+
+        frags - iterable of text fragments, split anywhere
+
+        >>> from amara3.uxml import tree
+        >>> [ root.xml_value for root in tree.treebuilder().parse_stream(['<a>1</a><b', '>2</b>']) ]
+        ['1', '2']
+        '''
+        self._root = None
+        self._parent = None
+        completed = self._completed = []
+        try:
+            p = parser(self._handler(), multidoc=True)
+            for frag in frags:
+                p.send((frag, False))
+                while completed:
+                    yield completed.pop(0)
+            p.send(('', True)) #Wrap it up
+            while completed:
+                yield completed.pop(0)
+        finally:
+            self._completed = None
+        return
+
 
 def name_test(name):
     def _name_test(ev):
@@ -5,14 +5,351 @@
 #
 # -----------------------------------------------------------------------------
 
+import copy
+import array
 import asyncio
 import collections
 
 from .parser import parser, parsefrags, event
-from .tree import element, text, name_test
+from .tree import element, text
+from .xml import read_chunks, DEFAULT_CHUNK_SIZE
 
 
-MATCHED_STATE = object()
+class step:
+    '''
+    Pattern step matching an element by name and by tests on its attributes,
+    checked against the start tag, so that subtrees which don't match are never built
+
+    >>> from amara3.uxml import treeiter
+    >>> values = [] #sink as in the sender example
+    >>> ts = treeiter.sender(('catalog', treeiter.step('record', {'type': 'book'})), sink(values))
+    >>> ts.parse('<catalog><record type="book">1</record><record type="cd">2</record></catalog>')
+    >>> values
+    ['1']
+
+    name - element name, or '*' for any element
+    attrs - dict from attribute name to condition, which is True if the attribute need only exist,
+        a string which the attribute value must equal, or a callable which is passed the attribute value
+        and returns True if it matches
+    '''
+    def __init__(self, name='*', attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self._key = (name, tuple(sorted(self.attrs.items(), key=lambda item: item[0])))
+
+    def attrs_match(self, attrs):
+        for aname, cond in self.attrs.items():
+            value = attrs.get(aname)
+            if value is None:
+                return False
+            if cond is True:
+                continue
+            if callable(cond):
+                if not cond(value): return False
+            elif value != cond:
+                return False
+        return True
+
+    def __call__(self, ev):
+        #Usable as an event test, e.g. among alternatives in a tuple stage
+        return ev[0] == event.start_element and self.name in ('*', ev[1]) and self.attrs_match(ev[2])
+
+    def __repr__(self):
+        return 'step({0}, {1})'.format(repr(self.name), repr(self.attrs))
+
+
+class _fieldnode:
+    '''
+    Node in the trie into which a field map's paths are compiled, corresponding to an element
+    relative to the matched element
+    '''
+    def __init__(self):
+        self.children = {}  #element name or '*' -> child node
+        self.attrs = []     #(field index, attribute name) pairs, from e.g. '@id'
+        self.texts = []     #indices of fields capturing child text, from e.g. 'text()'
+        self.values = []    #indices of fields capturing all descendant text, from e.g. '.'
+
+
+class fieldmap:
+    '''
+    Map of fields to be extracted from each subtree matching a pattern, straight from parse events,
+    without building any tree objects
+
+    >>> from amara3.uxml import treeiter
+    >>> values = [] #sink as in the sender example, but appending whatever it's sent
+    >>> fm = treeiter.fieldmap({'id': '@id', 'title': 'title/text()'})
+    >>> ts = treeiter.sender(('db', 'r'), sink(values), fields=fm)
+    >>> ts.parse('<db><r id="1"><title>A</title></r><r id="2"><title>B</title></r></db>')
+    >>> values
+    [{'id': '1', 'title': 'A'}, {'id': '2', 'title': 'B'}]
+
+    Each path is relative to the matched element, and is a sequence of element names (or '*')
+    separated by '/', optionally ending with '@name' for an attribute or 'text()' for child text.
+    A path ending with an element name, or '.' for the matched element itself, gives all text within.
+    As with MicroXPath string values, the first match in document order counts,
+    except that a text() field skips matching elements with no child text.
+    Fields with no match are None
+
+    spec - dict from field name to path
+    output - 'dict' to send each record as a dict, 'tuple' for a tuple in the order of spec,
+        or 'columns' to send batches of records as dicts from field name to a list of values
+    batch_size - maximum number of records per batch, for columns output. Any partial batch is sent at the end of each document
+    typecodes - for columns output, optional dict from field name to an array module typecode,
+        to collect values of that field into an array.array rather than a list.
+        Values are converted with float() for 'f' & 'd', otherwise int(). Missing values are an error
+    '''
+    def __init__(self, spec, output='dict', batch_size=1000, typecodes=None):
+        if output not in ('dict', 'tuple', 'columns'):
+            raise ValueError('Unknown field map output: {0}'.format(repr(output)))
+        self.names = tuple(spec)
+        self.output = output
+        self.batch_size = batch_size
+        self.typecodes = typecodes or {}
+        self.root = _fieldnode()
+        #Indices of the text() fields
+        self.text_fields = set()
+        for ix, path in enumerate(spec.values()):
+            steps = path.split('/')
+            last = steps.pop()
+            node = self.root
+            for name in steps:
+                if name != '.':
+                    node = node.children.setdefault(name, _fieldnode())
+            if last.startswith('@'):
+                node.attrs.append((ix, last[1:]))
+            elif last == 'text()':
+                node.texts.append(ix)
+                self.text_fields.add(ix)
+            else:
+                if last != '.':
+                    node = node.children.setdefault(last, _fieldnode())
+                node.values.append(ix)
+
+    def record(self, values):
+        if self.output == 'tuple':
+            return tuple(values)
+        return dict(zip(self.names, values))
+
+    def new_columns(self):
+        return { name: array.array(self.typecodes[name]) if name in self.typecodes else []
+                    for name in self.names }
+
+    def add_to_columns(self, columns, values):
+        for name, value in zip(self.names, values):
+            code = self.typecodes.get(name)
+            if code is not None:
+                if value is None:
+                    raise ValueError('Missing value for array column {0}'.format(repr(name)))
+                value = float(value) if code in 'fd' else int(value)
+            columns[name].append(value)
+        return
+
+
+class _extraction:
+    '''
+    State of the extraction of fields from one matched subtree
+    '''
+    def __init__(self, fmap):
+        self.fmap = fmap
+        self.values = [None] * len(fmap.names)
+        #Field map nodes for each open element (several where named & '*' paths both apply, none if no fields are within it),
+        #and the indices of the fields whose capture each one started
+        self.nodes = []
+        self.opened = []
+        #Field index -> text parts captured so far
+        self.parts = {}
+        #Indices of the fields capturing all descendant text
+        self.collecting = []
+
+    def start(self, ev):
+        if self.nodes:
+            active = []
+            for node in self.nodes[-1]:
+                for child in (node.children.get(ev[1]), node.children.get('*')):
+                    if child is not None:
+                        active.append(child)
+        else:
+            active = [self.fmap.root]
+        self.nodes.append(active)
+        opened = []
+        values, parts = self.values, self.parts
+        for node in active:
+            for ix, aname in node.attrs:
+                if values[ix] is None:
+                    values[ix] = ev[2].get(aname)
+            for ix in node.texts + node.values:
+                if values[ix] is None and ix not in parts:
+                    parts[ix] = []
+                    opened.append(ix)
+                    if ix in node.values:
+                        self.collecting.append(ix)
+        self.opened.append(opened)
+        return
+
+    def characters(self, ev):
+        opened = self.opened[-1]
+        for node in self.nodes[-1]:
+            for ix in node.texts:
+                if ix in opened:
+                    self.parts[ix].append(ev[1])
+        for ix in self.collecting:
+            self.parts[ix].append(ev[1])
+        return
+
+    def end(self):
+        '''
+        Returns True once the matched element has ended
+        '''
+        self.nodes.pop()
+        for ix in self.opened.pop():
+            parts = self.parts.pop(ix)
+            #A text() field stays open for later matches until it finds some text
+            if parts or ix not in self.fmap.text_fields:
+                self.values[ix] = ''.join(parts)
+            if ix in self.collecting:
+                self.collecting.remove(ix)
+        return not self.nodes
+
+
+#Marks elements outside a projection, which are not built
+_SKIP = object()
+
+
+def _merge_projections(target, source):
+    '''
+    Merge a copy of projection trie source into trie target, returning the result
+    '''
+    if target is None or source is None:
+        return None
+    for name, sub in source.items():
+        target[name] = _merge_projections(target.get(name, {}), sub) if name in target else copy.deepcopy(sub)
+    return target
+
+
+def _fold_wildcards(trie):
+    '''
+    Merge each '*' branch of a projection trie into its named siblings, so that a named child only needs one lookup
+    '''
+    if trie is None:
+        return
+    star = trie.get('*', _SKIP)
+    if star is not _SKIP:
+        for name in trie:
+            if name != '*':
+                trie[name] = _merge_projections(trie[name], star)
+    for sub in trie.values():
+        _fold_wildcards(sub)
+    return
+
+
+def _prep_projection(spec):
+    '''
+    Compile a projection spec into a trie of dicts from element name to the trie below it,
+    where None means keep the whole subtree. '*' branches are folded into named ones
+    '''
+    if spec is None:
+        return None
+    if isinstance(spec, str):
+        spec = [spec]
+    trie = {}
+    for path in spec:
+        names = path.split('/') if isinstance(path, str) else path
+        node = trie
+        for name in names[:-1]:
+            node = node.setdefault(name, {})
+            #A shorter path already keeps everything below
+            if node is None: break
+        else:
+            node[names[-1]] = None
+    _fold_wildcards(trie)
+    return trie
+
+
+class _patternnode:
+    '''
+    Node in the trie into which all of a sender's patterns are compiled
+    Edges for patterns with a common prefix are shared
+    '''
+    def __init__(self):
+        self.names = {}     #element name -> child node
+        self.altnames = {}  #element name -> list of child nodes for alternatives (tuple stages) including that name
+        self.star = None    #child node for '*'
+        self.dstar = None   #child node for '**', which loops back on itself
+        self.tests = []     #(event test callable, child node) pairs
+        self.guarded = {}   #element name or '*' -> list of (step, child node) pairs, for steps with attribute tests
+        self.steps = {}     #step key -> child node, so identical steps are shared
+        self.matches = []   #indices of the patterns which end at this node
+        self.alts = {}      #tuple stage -> child node, so identical alternatives are shared
+
+    def _closure(self, nodes):
+        #A '**' matches zero elements, so wherever a node is reached, so is its '**' child
+        nodes.add(self)
+        if self.dstar is not None and self.dstar not in nodes:
+            self.dstar._closure(nodes)
+        return nodes
+
+
+class _matchstate:
+    '''
+    Set of trie nodes active at one element, i.e. a state of the lazily-built DFA over the trie
+    Transitions are cached by element name, unless event test callables are involved
+    '''
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.matches = tuple(sorted(set( ix for node in nodes for ix in node.matches )))
+        self.tests = [ t for node in nodes for t in node.tests ]
+        self.guarded = {}
+        for node in nodes:
+            for name, steps in node.guarded.items():
+                self.guarded.setdefault(name, []).extend(steps)
+        self.guardedstar = self.guarded.pop('*', [])
+        self._cache = {}
+
+    def next(self, ev, states):
+        '''
+        Return the state following this one given a start_element event,
+        or None if no pattern can match from there on
+
+        states - dict of all states so far, shared so that equal node sets map to one state
+        '''
+        name = ev[1]
+        #Transitions depend only on the element name unless there are tests on the event or attributes
+        cacheable = not self.tests and not self.guardedstar and name not in self.guarded
+        if cacheable:
+            try:
+                return self._cache[name]
+            except KeyError:
+                pass
+        new_nodes = set()
+        for node in self.nodes:
+            child = node.names.get(name)
+            if child is not None:
+                child._closure(new_nodes)
+            for child in node.altnames.get(name, ()):
+                child._closure(new_nodes)
+            if node.star is not None:
+                node.star._closure(new_nodes)
+            if node.dstar is node:
+                new_nodes.add(node)
+        for test, child in self.tests:
+            if test(ev):
+                child._closure(new_nodes)
+        for st, child in self.guarded.get(name, ()):
+            if st.attrs_match(ev[2]):
+                child._closure(new_nodes)
+        for st, child in self.guardedstar:
+            if st.attrs_match(ev[2]):
+                child._closure(new_nodes)
+        if new_nodes:
+            key = frozenset(new_nodes)
+            new_state = states.get(key)
+            if new_state is None:
+                new_state = states[key] = _matchstate(key)
+        else:
+            new_state = None
+        if cacheable:
+            self._cache[name] = new_state
+        return new_state
 
 
 class sender:
@@ -31,7 +368,7 @@ class sender:
     >>> values
     ['1', '2', '3']
     '''
-    def __init__(self, patterns, sinks, prime_sinks=True):
+    def __init__(self, patterns, sinks, prime_sinks=True, projections=None, fields=None):
         '''
         Initializer
 
@@ -39,129 +376,197 @@ class sender:
             patterns - pattern or list of patterns for subtrees to be generated,
                 each a tuple of element names, or the special wildcards '*' or '**'
                 '*' matches any single element. '**' matches any nestign of elements to arbitrary depth.
+                A step object matches by name and also tests attributes, e.g. step('record', {'type': 'book'})
                 Resulting subtrees are sent to the corrersponding sink coroutine,
                 so number of patterns must match number of sinks
             sinks - coroutine to be sent element subtrees as generated from parse.
                 Each coroutine receives subtrees based on the corrersponding pattern,
                 so number of patterns must match number of sinks
             prime_sinks - if True call next() on each coroutine to get it started
+            projections - optional projection, or list of them corresponding to the patterns (None for no projection).
+                A projection is a collection of paths relative to the matched element, each an element name,
+                a tuple of names or a string such as 'author/name', with '*' for any element.
+                Only the elements along these paths and everything within the elements at their ends are built,
+                along with the matched element itself. Text along the way is skipped
+            fields - optional field map, or list of them corresponding to the patterns (None for none).
+                Either a fieldmap or a dict from field name to path, for records sent as dicts.
+                For a pattern with a field map, no subtree is built, and the sink is sent records
+                extracted from the parse, rather than elements. See fieldmap
+
+        All the patterns are compiled together, so that the cost of matching each element
+        hardly grows with the number of patterns
         '''
-        self._patterns = [patterns] if isinstance(patterns, tuple) and isinstance(patterns[0], str) else patterns
+        single = isinstance(patterns, tuple) and isinstance(patterns[0], (str, step))
+        self._patterns = [patterns] if single else patterns
         self._pattern_count = len(self._patterns)
         self._sinks = sinks if isinstance(sinks, list) or isinstance(sinks, tuple) else [sinks]
         if len(self._sinks) != self._pattern_count:
             raise ValueError('Number of patterns must match number of sinks')
-        self._roots = [None] * self._pattern_count
-        self._parents = [None] * self._pattern_count
-        self._stateses = [None] * self._pattern_count
-        self._evstacks = [[]] * self._pattern_count
-        self._building_depths = [0] * self._pattern_count
         #if asyncio.iscoroutine(sink):
         if prime_sinks:
             for sink in self._sinks:
                 if isinstance(sink, collections.Iterable):
                     next(sink)  # Prime coroutine
-        self._currents = [None] * self._pattern_count
+        if projections is None:
+            projections = [None] * self._pattern_count
+        elif single:
+            projections = [projections]
+        if len(projections) != self._pattern_count:
+            raise ValueError('Number of projections must match number of patterns')
+        self._projections = [ _prep_projection(spec) for spec in projections ]
+        if fields is None:
+            fields = [None] * self._pattern_count
+        elif single:
+            fields = [fields]
+        if len(fields) != self._pattern_count:
+            raise ValueError('Number of field maps must match number of patterns')
+        self._fields = [ fieldmap(f) if isinstance(f, dict) else f for f in fields ]
         self._prep_patterns()
 
-    def _only_name(self, next, name):
-        def _only_name_func(ev):
-            if ev[0] == event.start_element and ev[1] == name:
-                return next
-        return _only_name_func
-
-    def _any_name(self, next):
-        def _any_name_func(ev):
-            if ev[0] == event.start_element:
-                return next
-        return _any_name_func
-
-    def _any_until(self, next):
-        def _any_until_func(ev):
-            if ev[0] == event.start_element:
-                next_next = next(ev)
-                if next_next is not None:
-                    return next_next
-            return _any_until_func
-        return _any_until_func
-
-    def _any(self, next, funcs):
-        def _any_func(ev):
-            if any( (func(ev) for func in funcs) ):
-                return next
-        return _any_func
-
     def _prep_patterns(self):
-        next_state = MATCHED_STATE
+        root = _patternnode()
         for ix, pattern in enumerate(self._patterns):
-            for i in range(len(pattern)):
-                stage = pattern[-i-1]
+            node = root
+            for stage in pattern:
+                if isinstance(stage, step) and not stage.attrs:
+                    #Nothing to test beyond the name
+                    stage = stage.name
                 if isinstance(stage, str):
                     if stage == '*':
-                        next_state = self._any_name(next_state)
+                        if node.star is None: node.star = _patternnode()
+                        node = node.star
                     elif stage == '**':
-                        next_state = self._any_until(next_state)
+                        if node.dstar is None:
+                            node.dstar = _patternnode()
+                            node.dstar.dstar = node.dstar
+                        node = node.dstar
                     else:
-                        next_state = self._only_name(next_state, stage)
+                        if stage not in node.names: node.names[stage] = _patternnode()
+                        node = node.names[stage]
+                elif isinstance(stage, step):
+                    child = node.steps.get(stage._key)
+                    if child is None:
+                        child = node.steps[stage._key] = _patternnode()
+                        node.guarded.setdefault(stage.name, []).append((stage, child))
+                    node = child
                 elif isinstance(stage, tuple):
-                    new_tuple = tuple(( name_test(substage) if isinstance(substage, str) else substage for substage in stage ))
-                    next_state = self._any(next_state, new_tuple)
+                    child = node.alts.get(stage)
+                    if child is None:
+                        child = node.alts[stage] = _patternnode()
+                        for substage in stage:
+                            if isinstance(substage, str):
+                                node.altnames.setdefault(substage, []).append(child)
+                            else:
+                                node.tests.append((substage, child))
+                    node = child
                 else:
                     raise ValueError('Cannot interpret pattern component {0}'.format(repr(stage)))
-            self._stateses[ix] = next_state
+            node.matches.append(ix)
+        self._states = {}
+        start_nodes = frozenset(root._closure(set()))
+        self._start_state = self._states[start_nodes] = _matchstate(start_nodes)
         return
 
-    def _match_state(self, ix):
-        new_state = self._stateses[ix]
-        for depth, ev in enumerate(self._evstacks[ix]):
-            new_state = new_state(ev)
-            if new_state == MATCHED_STATE:
-                return True
-            elif new_state is None:
-                return False
-        return False
-
     @asyncio.coroutine
     def _handler(self):
+        states = self._states
+        #Match state for each open element, plus the initial state
+        statestack = [self._start_state]
+        projections = self._projections
+        #Subtrees being built: pattern index -> [depth within subtree, current parent element, top element,
+        #stack of projection tries, or None if there's no projection]
+        building = {}
+        fields = self._fields
+        #Field extractions in progress: pattern index -> _extraction
+        extracting = {}
+        #Batches of records for columns output: pattern index -> [columns, record count]
+        batches = {}
         while True:
             ev = yield
-            for ix, evstack in enumerate(self._evstacks):
-                building_depth = self._building_depths[ix]
-                parent = self._parents[ix]
-                if ev[0] == event.start_element:
-                    evstack.append(ev)
+            if ev[0] == event.start_element:
+                state = statestack[-1]
+                new_state = state.next(ev, states) if state is not None else None
+                statestack.append(new_state)
+                new_builds = [ ix for ix in new_state.matches if ix not in building and ix not in extracting ] if new_state is not None else ()
+                for ix in new_builds:
+                    if fields[ix] is not None:
+                        extracting[ix] = _extraction(fields[ix])
+                        continue
                     #Keep track of the depth while we're building elements. When we ge back to 0 depth, we're done for this subtree
-                    if building_depth:
-                        building_depth += 1
-                        self._building_depths[ix] = building_depth
-                    elif self._match_state(ix):
-                        building_depth = self._building_depths[ix] = 1
-                    if building_depth:
-                        new_element = element(ev[1], ev[2], parent)
-                        #if parent: parent().xml_children.append(weakref.ref(new_element))
-                        #Note: not using weakrefs here because these refs are not circular
-                        if parent: parent.xml_children.append(new_element)
-                        parent = self._parents[ix] = new_element
-                        #Hold a reference to the top element of the subtree being built,
-                        #or it will be garbage collected as the builder moves down the tree
-                        if building_depth == 1: self._roots[ix] = new_element
-                elif ev[0] == event.characters:
-                    if building_depth:
-                        new_text = text(ev[1], parent)
-                        if parent: parent.xml_children.append(new_text)
-                elif ev[0] == event.end_element:
-                    evstack.pop()
-                    if building_depth:
-                        building_depth -= 1
-                        self._building_depths[ix] = building_depth
+                    building[ix] = [0, None, None, None if projections[ix] is None else []]
+                for ext in extracting.values():
+                    ext.start(ev)
+                for ix, build in building.items():
+                    projstack = build[3]
+                    if projstack is not None:
+                        if projstack:
+                            proj = projstack[-1]
+                            if proj is not None and proj is not _SKIP:
+                                proj = proj.get(ev[1], proj.get('*', _SKIP))
+                        else:
+                            proj = projections[ix]
+                        projstack.append(proj)
+                        if proj is _SKIP:
+                            #Outside the projection. Just track the depth
+                            build[0] += 1
+                            continue
+                    parent = build[1]
+                    new_element = element(ev[1], ev[2], parent)
+                    #Namespace info, from namespace-preserving XML parse
+                    if len(ev) > 4:
+                        new_element.xml_nsid, new_element.xml_attr_nsids = ev[4]
+                    #Note: not using weakrefs here because these refs are not circular
+                    if parent is not None: parent.xml_children.append(new_element)
+                    #Hold a reference to the top element of the subtree being built,
+                    #or it will be garbage collected as the builder moves down the tree
+                    else: build[2] = new_element
+                    build[0] += 1
+                    build[1] = new_element
+            elif ev[0] == event.characters:
+                for build in building.values():
+                    if build[3] is None or build[3][-1] is None:
+                        parent = build[1]
+                        parent.xml_children.append(text(ev[1], parent))
+                for ext in extracting.values():
+                    ext.characters(ev)
+            elif ev[0] == event.end_element:
+                statestack.pop()
+                if extracting:
+                    for ix, ext in list(extracting.items()):
+                        if ext.end():
+                            del extracting[ix]
+                            self._send_record(ix, ext.values, batches)
+                #End of the document. Send any partial batches
+                if batches and len(statestack) == 1:
+                    for ix, (columns, count) in sorted(batches.items()):
+                        self._sinks[ix].send(columns)
+                    batches.clear()
+                if building:
+                    for ix, build in list(building.items()):
+                        parent = build[1]
+                        build[0] -= 1
                         #Done with this subtree
-                        if not building_depth:
+                        if not build[0]:
+                            del building[ix]
                             self._sinks[ix].send(parent)
-                        #Pop back up in element ancestry
-                        if parent:
-                            parent = self._parents[ix] = parent.xml_parent
+                        elif build[3] is None or build[3].pop() is not _SKIP:
+                            #Pop back up in element ancestry
+                            build[1] = parent.xml_parent
+        return
 
-                #print(ev, building_depth, evstack)
+    def _send_record(self, ix, values, batches):
+        fmap = self._fields[ix]
+        if fmap.output == 'columns':
+            batch = batches.get(ix)
+            if batch is None:
+                batch = batches[ix] = [fmap.new_columns(), 0]
+            fmap.add_to_columns(batch[0], values)
+            batch[1] += 1
+            if batch[1] >= fmap.batch_size:
+                del batches[ix]
+                self._sinks[ix].send(batch[0])
+        else:
+            self._sinks[ix].send(fmap.record(values))
         return
 
     def parse(self, doc):
@@ -170,3 +575,63 @@ class sender:
         p.send((doc, False))
         p.send(('', True))  # Wrap it up
         return
+
+    def parse_stream(self, frags):
+        '''
+        Parse a stream of concatenated MicroXML documents, given as an iterable of text fragments.
+        Patterns are matched against each document in turn
+        '''
+        h = self._handler()
+        p = parser(h, multidoc=True)
+        for frag in frags:
+            p.send((frag, False))
+        p.send(('', True))  # Wrap it up
+        return
+
+
+def _collector(matches):
+    '''
+    Sink which just queues up the subtrees it's sent, for iterparse
+    '''
+    while True:
+        matches.append((yield))
+
+
+def _source_chunks(source, chunk_size):
+    if isinstance(source, (str, bytes)):
+        return [source]
+    elif hasattr(source, 'read'):
+        return read_chunks(source, chunk_size)
+    return source
+
+
+def iterparse(source, pattern, chunk_size=DEFAULT_CHUNK_SIZE, projection=None, fields=None):
+    '''
+    Parse MicroXML, yielding each subtree matching the pattern, as soon as the chunk
+    of input containing its end tag has been parsed. Subtrees are not otherwise retained,
+    so each can be reclaimed once the caller is done with it, and input is only read
+    as far as the caller consumes results
+
+    source - MicroXML text, a file-like object (read chunk_size at a time) or an iterable of text fragments
+    pattern - as for sender, or a MicroXPath string as accepted by uxpath.compile_pattern
+    projection - optional projection for the pattern, as for sender
+    fields - optional field map for the pattern, as for treeiter.sender, in which case records are yielded rather than subtrees
+
+    >>> from amara3.uxml import treeiter
+    >>> [ e.xml_value for e in treeiter.iterparse('<a><b>1</b><b>2</b><b>3</b></a>', ('a', 'b')) ]
+    ['1', '2', '3']
+    '''
+    if isinstance(pattern, str):
+        from .uxpath import compile_pattern
+        pattern = compile_pattern(pattern)
+    matches = collections.deque()
+    ts = sender(pattern, _collector(matches), projections=projection, fields=fields)
+    p = parser(ts._handler())
+    for chunk in _source_chunks(source, chunk_size):
+        p.send((chunk, False))
+        while matches:
+            yield matches.popleft()
+    p.send(('', True))
+    while matches:
+        yield matches.popleft()
+    return
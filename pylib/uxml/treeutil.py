@@ -5,7 +5,11 @@ some operations widely associated with DOM, but in the form of utility functions
 rather than methods.
 '''
 
+import sys
+import difflib
+import hashlib
 import itertools
+import tracemalloc
 from amara3.uxml.tree import *
 
 def descendants(elem):
@@ -234,3 +238,179 @@ def make_pretty(elem, depth=0, indent='  '):
         #updated_child_ix += 1 #About to be done, so not really needed
     elem.xml_children = updated_child_list
     return elem
+
+
+def _node_size(node, seen_strings):
+    '''
+    Rough estimate of memory retained by one node, not counting its children
+    Strings are counted only the first time they're seen, since they're often shared
+    '''
+    size = sys.getsizeof(node)
+    #Element state is in slots. Looking up an element's __dict__ would allocate it, so only count text nodes'
+    if not isinstance(node, element) and getattr(node, '__dict__', None) is not None:
+        size += sys.getsizeof(node.__dict__)
+    if node._xml_parent is not None:
+        size += sys.getsizeof(node._xml_parent)
+    if isinstance(node, element):
+        size += sys.getsizeof(node.xml_children) + sys.getsizeof(node.xml_attributes)
+        for s in itertools.chain([node.xml_name], node.xml_attributes.keys(), node.xml_attributes.values()):
+            if id(s) not in seen_strings:
+                seen_strings.add(id(s))
+                size += sys.getsizeof(s)
+    return size
+
+
+def tree_stats(root):
+    '''
+    Gather statistics about the tree rooted at the given element, in one iterative pass
+
+    Returns a dict with the following keys:
+
+    elements - count of element nodes
+    texts - count of text nodes
+    attributes - count of attributes across all elements
+    max_depth - depth of the deepest node, counting root as 1
+    names - count of distinct element names
+    text_bytes - total size of text content, UTF-8 encoded
+    memory - estimated bytes retained by the tree (based on sys.getsizeof)
+    memory_by_type - dict of estimated bytes per node type, 'element' & 'text'
+    memory_by_name - dict of estimated bytes per element name, including the element's text children
+
+    >>> from amara3.uxml import tree
+    >>> from amara3.uxml.treeutil import tree_stats
+    >>> stats = tree_stats(tree.parse('<a x="1"><b>c</b><b>d</b></a>'))
+    >>> stats['elements'], stats['texts'], stats['attributes'], stats['max_depth'], stats['names']
+    (3, 2, 1, 3, 2)
+    '''
+    stats = {
+        'elements': 0, 'texts': 0, 'attributes': 0, 'max_depth': 0,
+        'names': 0, 'text_bytes': 0, 'memory': 0,
+    }
+    by_type = {'element': 0, 'text': 0}
+    by_name = {}
+    seen_strings = set()
+    to_visit = [(root, 1)]
+    while to_visit:
+        node, depth = to_visit.pop()
+        size = _node_size(node, seen_strings)
+        if isinstance(node, element):
+            stats['elements'] += 1
+            stats['attributes'] += len(node.xml_attributes)
+            by_type['element'] += size
+            by_name[node.xml_name] = by_name.get(node.xml_name, 0) + size
+            to_visit.extend(( (child, depth + 1) for child in reversed(node.xml_children) ))
+        else:
+            stats['texts'] += 1
+            stats['text_bytes'] += len(node.encode('utf-8'))
+            by_type['text'] += size
+            parent = node.xml_parent
+            if parent is not None:
+                by_name[parent.xml_name] = by_name.get(parent.xml_name, 0) + size
+        if depth > stats['max_depth']:
+            stats['max_depth'] = depth
+    stats['names'] = len(by_name)
+    stats['memory'] = by_type['element'] + by_type['text']
+    stats['memory_by_type'] = by_type
+    stats['memory_by_name'] = by_name
+    return stats
+
+
+def traced_parse(source, builder=None):
+    '''
+    Parse the source with tracemalloc running, to measure actual allocation rather than estimate it
+
+    source - document to parse
+    builder - tree builder to use, e.g. amara3.uxml.xml.treebuilder(). Defaults to tree.treebuilder() for MicroXML
+
+    Returns (root, allocated, peak), where allocated is bytes still held once the parse is done,
+    i.e. roughly the memory retained by the tree, and peak is the high water mark during the parse
+    '''
+    builder = builder or treebuilder()
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        start_current, _ = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        root = builder.parse(source)
+        end_current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    return root, end_current - start_current, peak - start_current
+
+
+def _text_digest(value):
+    return hashlib.sha1(b'T\0' + value.encode('utf-8')).digest()
+
+
+def subtree_hash(node):
+    '''
+    Return a canonical content hash (bytes digest) of the node and its descendants
+
+    Equal hashes mean equal names, attributes (in any order) and content. Adjacent text nodes
+    are treated as one, so differences in how a parser splits up text don't matter.
+    Computed bottom-up in one iterative pass, and cached on each element. The cache is
+    invalidated by the xml_ mutation methods; if you modify xml_children or xml_attributes
+    directly, call xml_invalidate() on the modified element.
+
+    >>> from amara3.uxml import tree
+    >>> from amara3.uxml.treeutil import subtree_hash
+    >>> subtree_hash(tree.parse('<a x="1" y="2">b</a>')) == subtree_hash(tree.parse('<a y="2" x="1">b</a>'))
+    True
+    '''
+    if not isinstance(node, element):
+        return _text_digest(node)
+    if node._xml_hash is not None:
+        return node._xml_hash
+    #Post-order traversal: each element is visited again once all its children are hashed
+    to_visit = [(node, False)]
+    while to_visit:
+        elem, children_done = to_visit.pop()
+        if not children_done:
+            to_visit.append((elem, True))
+            to_visit.extend(( (child, False) for child in elem.xml_children
+                                if isinstance(child, element) and child._xml_hash is None ))
+            continue
+        h = hashlib.sha1(b'E\0')
+        h.update(elem.xml_name.encode('utf-8'))
+        for aname, aval in sorted(elem.xml_attributes.items()):
+            h.update(b'\0A\0' + aname.encode('utf-8') + b'\0' + aval.encode('utf-8'))
+        pending_text = []
+        for child in elem.xml_children:
+            if isinstance(child, element):
+                if pending_text:
+                    h.update(_text_digest(''.join(pending_text)))
+                    pending_text = []
+                h.update(child._xml_hash)
+            else:
+                pending_text.append(child)
+        if pending_text:
+            h.update(_text_digest(''.join(pending_text)))
+        elem._xml_hash = h.digest()
+    return node._xml_hash
+
+
+def diff_children(old, new):
+    '''
+    Compare the children of two elements, using subtree hashes so identical subtrees are
+    skipped without walking them
+
+    Yields (tag, old_nodes, new_nodes) for each span of children that differs, where tag is
+    'replace', 'delete' or 'insert', as with difflib.SequenceMatcher.get_opcodes()
+
+    >>> from amara3.uxml import tree
+    >>> from amara3.uxml.treeutil import diff_children
+    >>> old = tree.parse('<a><b>1</b><b>2</b><b>3</b></a>')
+    >>> new = tree.parse('<a><b>1</b><b>two</b><b>3</b></a>')
+    >>> [ (tag, [ e.xml_value for e in o ], [ e.xml_value for e in n ]) for (tag, o, n) in diff_children(old, new) ]
+    [('replace', ['2'], ['two'])]
+    '''
+    old_children, new_children = old.xml_children, new.xml_children
+    old_hashes = [ subtree_hash(child) for child in old_children ]
+    new_hashes = [ subtree_hash(child) for child in new_children ]
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            yield tag, old_children[i1:i2], new_children[j1:j2]
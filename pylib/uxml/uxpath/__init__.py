@@ -34,7 +34,7 @@ from amara3.util import coroutine
 from . import lexrules, parserules, ast
 from .functions import BUILTIN_FUNCTIONS
 
-__all__ = ['lexer', 'parser', 'parse', 'context']#, 'serialize']
+__all__ = ['lexer', 'parser', 'parse', 'context', 'compile_pattern']#, 'serialize']
 
 
 lexer = None
@@ -72,6 +72,81 @@ def parse(xpath):
     return parser.parse(xpath, lexer=lexer)#, debug=True)
 
 
+def compile_pattern(xpath_thing):
+    '''
+    Compile a forward-only MicroXPath expression into a pattern for treeiter.sender & its subclasses,
+    so that matches can be streamed rather than queried from a fully built tree
+
+    Supported: child & descendant axes (including the / and // abbreviations) with name tests or *,
+    and predicates testing for the existence (@a) or value (@a='x') of attributes, combined with and.
+    Relative expressions start from the root, like absolute ones.
+    Raises ValueError for anything else
+
+    xpath_thing - string or parsed XPath expression
+
+    >>> from amara3.uxml.uxpath import compile_pattern
+    >>> compile_pattern("//record[@status='active']/item")
+    ('**', step('record', {'status': 'active'}), 'item')
+    '''
+    from amara3.uxml.treeiter import step
+    expr = parse(xpath_thing) if isinstance(xpath_thing, str) else xpath_thing
+
+    def unsupported(item):
+        return ValueError('Cannot compile to a streaming pattern: {0}'.format(ast.serialize(item)))
+
+    def attr_conditions(pred, conds):
+        if isinstance(pred, ast.Step) and pred.axis == 'attribute' and pred.node_test.name != '*':
+            conds.setdefault(pred.node_test.name, True)
+        elif isinstance(pred, ast.BinaryExpression) and pred.op == 'and':
+            attr_conditions(pred.left, conds)
+            attr_conditions(pred.right, conds)
+        elif isinstance(pred, ast.BinaryExpression) and pred.op == '=':
+            attr, value = pred.left, pred.right
+            if isinstance(attr, ast.LiteralWrapper):
+                attr, value = value, attr
+            if not (isinstance(attr, ast.Step) and attr.axis == 'attribute'
+                    and attr.node_test.name != '*'
+                    and isinstance(value, ast.LiteralWrapper) and isinstance(value.obj, str)):
+                raise unsupported(pred)
+            if conds.get(attr.node_test.name, True) not in (True, value.obj):
+                raise unsupported(pred)
+            conds[attr.node_test.name] = value.obj
+        else:
+            raise unsupported(pred)
+        return conds
+
+    def stages(item):
+        if isinstance(item, ast.AbsolutePath):
+            if not item.relative:
+                raise unsupported(item)
+            prefix = ['**'] if item.op == '//' else []
+            return prefix + stages(item.relative)
+        elif isinstance(item, ast.BinaryExpression) and item.op in ('/', '//'):
+            left = stages(item.left)
+            if isinstance(item.right, ast.AbsolutePath):
+                raise unsupported(item)
+            return left + (['**'] if item.op == '//' else []) + stages(item.right)
+        elif isinstance(item, ast.Step) and isinstance(item.node_test, ast.NameTest):
+            if item.axis == 'child':
+                return [item.node_test.name]
+            elif item.axis == 'descendant':
+                return ['**', item.node_test.name]
+        elif isinstance(item, ast.PredicatedExpression):
+            result = stages(item.lhs)
+            conds = {}
+            for pred in item.predicates:
+                attr_conditions(pred, conds)
+            last = result[-1]
+            if isinstance(last, step):
+                conds = dict(last.attrs, **conds)
+                last = last.name
+            result[-1] = step(last, conds)
+            return result
+        raise unsupported(item)
+
+    return tuple(stages(expr))
+
+
 class context(object):
     def __init__(self, item, pos=None, variables=None, functions=None, lookuptables=None, extras=None, parent=None, force_root=True):
         '''
@@ -121,53 +121,94 @@ class namespacer(raw):
     '''
     Writer that adds namespace information to output
 
-    mapping = {}
+    Namespaces can come from an xml.nstable, for elements & attributes parsed in
+    namespace-preserving mode, in which case pass their namespace ids to start_element.
+    Alternatively a mapping from element name (or '@' + attribute name) to (namespace, prefix)
 
     >>> import io
-    >>> from amara3.uxml import writer
+    >>> from amara3.uxml import writer, xml
+    >>> root = xml.treebuilder(namespaces=True).parse('<a:spam xmlns:a="urn:x">eggs</a:spam>')
     >>> fp = io.StringIO()
-    >>> w = writer.raw(fp)
-    >>> w.start_element('spam')
-    >>> w.text('eggs')
-    >>> w.end_element('spam')
+    >>> w = writer.namespacer(fp, namespaces=root.xml_namespaces)
+    >>> writer.write(root, w)
     >>> fp.getvalue()
-    '<spam>eggs</spam>'
+    '<a:spam xmlns:a="urn:x">eggs</a:spam>'
     '''
-    def __init__(self, fp, whandler=None, prefixes=None, mapping=None):
+    def __init__(self, fp, whandler=None, prefixes=None, mapping=None, namespaces=None):
         raw.__init__(self, fp=fp, whandler=whandler)
         self._mapping = mapping or {}
         self._prefixes = prefixes or {}
+        self._namespaces = namespaces
+        #With an nstable, the default namespace is declared (or undeclared with xmlns="") wherever it changes,
+        #so that elements in no namespace don't fall into it
+        self._track_default = namespaces is not None and not prefixes
+        if self._track_default:
+            #Declare all the prefixes from the table up front
+            for nsid in range(1, len(namespaces)):
+                uri, prefix, attr_prefix = namespaces.uris[nsid], namespaces.prefixes[nsid], namespaces.attr_prefixes[nsid]
+                if prefix == 'xml': continue
+                if prefix: self._prefixes[prefix] = uri
+                if attr_prefix and attr_prefix != prefix: self._prefixes[attr_prefix] = uri
+        #Default namespace in scope for each open element, & any declaration due on the current one
+        self._default_stack = [None]
+        self._default_decl = None
+        self._nsid_stack = []
+        self._attr_nsids = None
         self._first_element = True
         return
 
-    def start_element(self, name, attribs=None):
+    def start_element(self, name, attribs=None, nsid=0, attr_nsids=None):
         self._ns_handled = False
+        self._nsid_stack.append(nsid)
+        self._attr_nsids = attr_nsids
+        in_scope = default = self._default_stack[-1]
+        self._default_decl = None
+        if self._track_default and not (nsid and self._namespaces.prefixes[nsid]):
+            default = self._namespaces.uris[nsid] if nsid else None
+            if default != in_scope: self._default_decl = default or ''
+        self._default_stack.append(default)
         raw.start_element(self, name, attribs=attribs)
         self._first_element = False
 
+    def end_element(self, name):
+        raw.end_element(self, name)
+        self._nsid_stack.pop()
+        self._default_stack.pop()
+
+    def _write_decl(self, prefix, uri):
+        self._fp.write(TOKENS[token.pre_attr])
+        self._fp.write('xmlns:' + prefix if prefix else 'xmlns')
+        self._fp.write(TOKENS[token.attr_equals])
+        self._fp.write(TOKENS[token.attr_quote])
+        self._fp.write(escape(uri, {'"': '&quot;'}))
+        self._fp.write(TOKENS[token.attr_quote])
+
+    def _prefix(self, ctx, text):
+        if self._namespaces is not None:
+            if ctx == context.element_name:
+                nsid = self._nsid_stack[-1] if self._nsid_stack else 0
+                return self._namespaces.prefixes[nsid] if nsid else None
+            nsid = self._attr_nsids.get(text, 0) if self._attr_nsids else 0
+            return self._namespaces.attr_prefixes[nsid] if nsid else None
+        key = text if ctx == context.element_name else '@' + text
+        return self._mapping.get(key, ('', ''))[1]
+
     def write(self, ctx, text):
         if ctx in (context.text, context.attribute_text):
             text = escape(text)
         if ctx == context.start_element:
-            if self._first_element and text in (token.pre_attr, token.start_close) and not self._ns_handled:
+            if text in (token.pre_attr, token.start_close) and not self._ns_handled:
                 #Namespace declarations here
-                for k, v in self._prefixes.items():
-                    self._fp.write(TOKENS[token.pre_attr])
-                    self._fp.write('xmlns:' + k if k else 'xmlns')
-                    self._fp.write(TOKENS[token.attr_equals])
-                    self._fp.write(TOKENS[token.attr_quote])
-                    self._fp.write(v)
-                    self._fp.write(TOKENS[token.attr_quote])
+                if self._default_decl is not None:
+                    self._write_decl(None, self._default_decl)
+                if self._first_element:
+                    for k, v in self._prefixes.items():
+                        self._write_decl(k, v)
                 #self._fp.write(TOKENS[token.pre_attr])
                 self._ns_handled = True
-        if ctx == context.element_name:
-            #Include prefix, if there's one
-            prefix = self._mapping.get(text, ('', ''))[1]
-            if prefix:
-                self._fp.write(prefix + ':')
-        if ctx == context.attribute_name:
+        if ctx in (context.element_name, context.attribute_name):
             #Include prefix, if there's one
-            prefix = self._mapping.get('@' + text, ('', ''))[1]
+            prefix = self._prefix(ctx, text)
             if prefix:
                 self._fp.write(prefix + ':')
         if isinstance(text, token): text = TOKENS[text]
@@ -181,7 +222,10 @@ def write(elem, a_writer):
     elem - Amara MicroXML element node to be written out
     writer - instance of amara3.uxml.writer to implement the writing process
     '''
-    a_writer.start_element(elem.xml_name, attribs=elem.xml_attributes)
+    if isinstance(a_writer, namespacer):
+        a_writer.start_element(elem.xml_name, attribs=elem.xml_attributes, nsid=elem.xml_nsid, attr_nsids=elem.xml_attr_nsids)
+    else:
+        a_writer.start_element(elem.xml_name, attribs=elem.xml_attributes)
     for node in elem.xml_children:
         if isinstance(node, tree.element):
             write(node, a_writer)
@@ -5,9 +5,13 @@
 #
 # -----------------------------------------------------------------------------
 
+import gc
+import sys
+import codecs
 import asyncio
+import weakref
 import xml.parsers.expat
-from xml.sax.saxutils import escape  # also quoteattr?
+from xml.sax.saxutils import escape, quoteattr
 
 from . import tree
 from .parser import parser, parsefrags, event
@@ -17,24 +21,43 @@ class expat_callbacks(object):
     def __init__(self, handler, prime_handler=True):
         self._handler = handler
         self._elem_stack = []
+        #Memos from expat qualified names ("uri local", or just "local") to interned local names,
+        #and to (uri, local) pairs. The same few names tend to recur throughout a document
+        self._local_names = {}
+        self._split_names = {}
         #if asyncio.iscoroutine(handler):
         if prime_handler:
             next(handler)  # Prime coroutine
         return
 
+    def _local(self, name):
+        local = self._local_names[name] = sys.intern(name.rpartition(' ')[2])
+        return local
+
+    def _split(self, name):
+        '''
+        Return (namespace, local) for an expat qualified name, with None namespace if there is none
+        '''
+        pair = self._split_names.get(name)
+        if pair is None:
+            ns = name.rpartition(' ')[0]
+            pair = self._split_names[name] = (ns or None, self._local_names.get(name) or self._local(name))
+        return pair
+
     def start_element(self, name, attrs):
         #print('Start element:', name, attrs)
-        local = name.split()[-1]
+        local_names = self._local_names
+        local = local_names.get(name) or self._local(name)
         #print(attrs, name)
         new_attrs = {}
         for aname, aval in attrs.items():
-            new_attrs[aname.split()[-1]] = aval
+            new_attrs[local_names.get(aname) or self._local(aname)] = aval
         self._handler.send((event.start_element, local, new_attrs, self._elem_stack.copy()))
         self._elem_stack.append(local)
 
     def end_element(self, name):
         #print('End element:', name)
-        local = name.split()[1] if ' ' in name else name
+        local = self._local_names.get(name) or self._local(name)
         self._elem_stack.pop()
         self._handler.send((event.end_element, local, self._elem_stack.copy()))
 
@@ -49,9 +72,77 @@ class expat_callbacks(object):
         pass
 
 
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+
+class nstable(object):
+    '''
+    Compact per-document table of namespaces. Elements and attributes refer to namespaces
+    by small integer id (see tree.element.xml_nsid) rather than each holding the URI.
+    Id 0 is always the null namespace.
+
+    >>> from amara3.uxml import xml
+    >>> t = xml.nstable()
+    >>> t.declare('a', 'urn:x')
+    1
+    >>> t.uris[1], t.prefixes[1]
+    ('urn:x', 'a')
+    '''
+    def __init__(self):
+        self.uris = [None]
+        #Preferred prefix for each namespace, None meaning the default namespace
+        self.prefixes = [None]
+        #Prefix for each namespace as used on attributes, which can't use the default namespace.
+        #None until an attribute is found in that namespace
+        self.attr_prefixes = [None]
+        self._ids = {None: 0}
+
+    def id(self, uri):
+        '''
+        Return the id for a namespace URI, adding it to the table if need be
+        '''
+        nsid = self._ids.get(uri)
+        if nsid is None:
+            nsid = self._ids[uri] = len(self.uris)
+            #Prefix for a namespace used without declaration, which should only be the XML namespace
+            prefix = 'xml' if uri == XML_NAMESPACE else 'ns{0}'.format(nsid)
+            self.uris.append(uri)
+            self.prefixes.append(prefix)
+            self.attr_prefixes.append(None)
+        return nsid
+
+    def attr_id(self, uri):
+        '''
+        Return the id for a namespace URI used on an attribute, making sure it has a non-default prefix
+        '''
+        nsid = self.id(uri)
+        if nsid and self.attr_prefixes[nsid] is None:
+            prefix = self.prefixes[nsid]
+            self.attr_prefixes[nsid] = prefix if prefix else 'ns{0}'.format(nsid)
+        return nsid
+
+    def declare(self, prefix, uri):
+        '''
+        Note a prefix declaration. The first prefix declared for a URI is preferred,
+        unless that prefix is already preferred for another URI
+        '''
+        known = uri in self._ids
+        nsid = self.id(uri)
+        if not known and prefix not in self.prefixes[1:]:
+            self.prefixes[nsid] = prefix
+        return nsid
+
+    def __len__(self):
+        return len(self.uris)
+
+
 class ns_expat_callbacks(expat_callbacks):
-    def __init__(self, handler, asyncio_based_handler=True, stream=False):
-        expat_callbacks.__init__(self, handler, asyncio_based_handler=asyncio_based_handler)
+    '''
+    Callbacks which preserve namespace information in a compact nstable, available as the namespaces attribute.
+    Start element events get an extra item, (element namespace id, dict of namespace ids of namespaced attributes or None)
+    '''
+    def __init__(self, handler, prime_handler=True, stream=False, namespaces=None):
+        expat_callbacks.__init__(self, handler, prime_handler=prime_handler)
         #Namespace mappings encountered through the document, updated dynamically as the document is traversed
         self.prefixes = {}
         self.prefixes_rev = {}
@@ -60,35 +151,154 @@ class ns_expat_callbacks(expat_callbacks):
         #For best results always use namespace normal form:
         # http://www.ibm.com/developerworks/library/x-namcar/
         self._stream = stream
-        #Heuristic structure suggesting output namespaces to generate
-        #element: (prefix, namespace)
-        self.ns_portfolio = {}
+        self.namespaces = namespaces if namespaces is not None else nstable()
+        #Memos from expat qualified names to namespace ids, for elements & for attributes
+        self._nsids = {}
+        self._attr_nsids = {}
         return
 
     def start_namespace(self, prefix, ns):
         self.prefixes[prefix] = ns
         self.prefixes_rev[ns] = prefix
+        self.namespaces.declare(prefix, ns)
 
     def end_namespace(self, prefix):
         if self._stream: del self.prefixes[prefix]
 
+    def reset_namespaces(self):
+        '''
+        Start a fresh namespace table, e.g. for a new document
+        '''
+        self.prefixes.clear()
+        self.prefixes_rev.clear()
+        self.namespaces = nstable()
+        self._nsids.clear()
+        self._attr_nsids.clear()
+
+    def _nsid(self, name):
+        nsid = self._nsids[name] = self.namespaces.id(self._split(name)[0])
+        return nsid
+
+    def _attr_nsid(self, name):
+        nsid = self._attr_nsids[name] = self.namespaces.attr_id(self._split(name)[0])
+        return nsid
+
     def start_element(self, name, attrs):
         #print('Start element:', name, attrs)
-        ns, local = name.split() if ' ' in name else (None, name)
-        if local not in self.ns_portfolio:
-            self.ns_portfolio[local] = (ns, self.prefixes_rev[ns])
+        local_names, nsids, attr_nsids_memo = self._local_names, self._nsids, self._attr_nsids
+        local = local_names.get(name) or self._local(name)
+        nsid = nsids.get(name)
+        if nsid is None: nsid = self._nsid(name)
+        new_attrs = {}
+        attr_nsids = None
         for aname, aval in attrs.items():
-            ans, alocal = aname.split() if ' ' in aname else (None, aname)
-            self.ns_portfolio['@' + alocal] = (ans, self.prefixes_rev.get(ans, ''))
-        expat_callbacks.start_element(self, name, attrs)
+            alocal = local_names.get(aname) or self._local(aname)
+            new_attrs[alocal] = aval
+            ansid = attr_nsids_memo.get(aname)
+            if ansid is None: ansid = self._attr_nsid(aname)
+            if ansid:
+                if attr_nsids is None: attr_nsids = {}
+                attr_nsids[alocal] = ansid
+        self._handler.send((event.start_element, local, new_attrs, self._elem_stack.copy(), (nsid, attr_nsids)))
+        self._elem_stack.append(local)
+
+
+#Default size of pieces fed to expat from files, also used for expat's character data buffer
+DEFAULT_CHUNK_SIZE = 64 * 1024
+#Character data buffer for parsing many small documents, where a large buffer per parse is wasteful
+SMALL_DOC_BUFFER_SIZE = 4 * 1024
+
+
+def expat_parser(callbacks, buffer_size=DEFAULT_CHUNK_SIZE, encoding=None):
+    '''
+    Create an expat parser wired up to the given callbacks object, with text buffering on,
+    so that runs of character data arrive in as few calls as possible
+
+    encoding - if given, overrides any encoding declared by the document
+    '''
+    p = xml.parsers.expat.ParserCreate(encoding, namespace_separator=' ')
+    p.buffer_text = True
+    p.buffer_size = buffer_size
+    p.StartElementHandler = callbacks.start_element
+    p.EndElementHandler = callbacks.end_element
+    p.CharacterDataHandler = callbacks.char_data
+    p.StartNamespaceDeclHandler = callbacks.start_namespace
+    p.EndNamespaceDeclHandler = callbacks.end_namespace
+    return p
+
 
+def feed_chunks(expat_parser, chunks):
+    '''
+    Feed an iterable of string or bytes chunks to an expat parser, then finish the parse
+    '''
+    for chunk in chunks:
+        expat_parser.Parse(chunk, False)
+    expat_parser.Parse(b'', True)
+    return
+
+
+JUNK_AFTER_DOC_ELEMENT = xml.parsers.expat.errors.codes[xml.parsers.expat.errors.XML_ERROR_JUNK_AFTER_DOC_ELEMENT]
+
+
+def feed_stream(new_parser, chunks):
+    '''
+    Feed a stream of concatenated XML documents to expat, which only handles one document per parser.
+    Where expat reports junk after the document element, a fresh parser picks up from that point.
+
+    new_parser - callable returning a new expat parser, wired up for callbacks. It's passed an encoding
+        to override any declared by the documents, or None
+    chunks - iterable of string or bytes chunks, split anywhere, all of one type. As with parsing a single
+        string, the encoding declared by a document given as string chunks is ignored
 
-def parse(source, handler):
+    Generator which yields after each chunk, so the caller can deal with whatever documents have been completed
+    '''
+    p = None
+    #Bytes fed to the current parser before the current chunk
+    consumed = 0
+    for chunk in chunks:
+        #Error positions are byte offsets. Strings are fed as UTF-8, overriding any declared encoding
+        encoding = None
+        if isinstance(chunk, str):
+            chunk, encoding = chunk.encode('utf-8'), 'utf-8'
+        if p is None:
+            p = new_parser(encoding)
+        while chunk:
+            try:
+                p.Parse(chunk, False)
+            except xml.parsers.expat.ExpatError as e:
+                if e.code != JUNK_AFTER_DOC_ELEMENT: raise
+                chunk = chunk[p.ErrorByteIndex - consumed:]
+                p = new_parser(encoding)
+                consumed = 0
+            else:
+                consumed += len(chunk)
+                break
+        yield
+    if p is None:
+        p = new_parser(None)
+    p.Parse(b'', True)
+    yield
+
+
+def read_chunks(fp, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Yield successive chunks read from a file-like object
+    '''
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def parse(source, handler, chunk_size=DEFAULT_CHUNK_SIZE):
     '''
     Convert XML 1.0 to MicroXML
 
-    source - XML 1.0 input
+    source - XML 1.0 input, either a string, a file-like object or an iterable of string or bytes chunks.
+        Files are read chunk_size at a time, so they never have to be held in memory whole
     handler - MicroXML events handler
+    chunk_size - size of pieces read from files, also used for expat's text buffer
 
     Returns uxml, extras
 
@@ -96,14 +306,13 @@ def parse(source, handler):
     extras - information to be preserved but not part of MicroXML, e.g. namespaces
     '''
     h = expat_callbacks(handler)
-    p = xml.parsers.expat.ParserCreate(namespace_separator=' ')
-
-    p.StartElementHandler = h.start_element
-    p.EndElementHandler = h.end_element
-    p.CharacterDataHandler = h.char_data
-    p.StartNamespaceDeclHandler = h.start_namespace
-    p.EndNamespaceDeclHandler = h.end_namespace
-    p.Parse(source)
+    p = expat_parser(h, buffer_size=chunk_size)
+    if isinstance(source, (str, bytes)):
+        p.Parse(source, True)
+    elif hasattr(source, 'read'):
+        feed_chunks(p, read_chunks(source, chunk_size))
+    else:
+        feed_chunks(p, source)
     return p
 
 
@@ -116,16 +325,425 @@ class treebuilder(tree.treebuilder):
     b = xml.treebuilder()
     root = b.parse('<spam/>')
     root
+
+    with open('spam.xml', 'rb') as fp:
+        root = b.parse_file(fp)
     '''
+    def __init__(self, values=None, namespaces=False):
+        '''
+        values - optional valuetable for sharing names & attribute values, possibly with other builders
+        namespaces - if True preserve namespaces. Each root gets an xml_namespaces nstable, which the
+            xml_nsid & xml_attr_nsids of its elements refer to
+        '''
+        tree.treebuilder.__init__(self, values=values)
+        self._ns_aware = namespaces
+        self.namespaces = None
+
+    def reset(self):
+        '''
+        Get ready for a fresh parse, keeping the event handler coroutine & expat callbacks
+        objects from any previous one. Called by all the parse methods
+        '''
+        self._root = None
+        self._parent = None
+        handler = getattr(self, 'handler', None)
+        #Also start over if an exception in a previous parse finished off the handler coroutine
+        if handler is None or getattr(handler._handler, 'gi_frame', True) is None:
+            if self._ns_aware:
+                self.handler = ns_expat_callbacks(self._handler())
+            else:
+                self.handler = expat_callbacks(self._handler())
+        else:
+            #Left over from an aborted parse, perhaps
+            handler._elem_stack.clear()
+            if self._ns_aware:
+                handler.reset_namespaces()
+        if self._ns_aware:
+            self.namespaces = self.handler.namespaces
+        return
+
+    def _prep_parse(self, buffer_size=DEFAULT_CHUNK_SIZE):
+        self.reset()
+        #Expat parsers can't be reused, but they're cheap to create
+        self.expat_parser = expat_parser(self.handler, buffer_size=buffer_size)
+        return self.expat_parser
+
+    def _finish_parse(self):
+        if self._ns_aware and self._root is not None:
+            self._root.xml_namespaces = self.namespaces
+        return self._root
+
     def parse(self, source):
-        self.handler = expat_callbacks(self._handler())
-        self.expat_parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
-
-        self.expat_parser.StartElementHandler = self.handler.start_element
-        self.expat_parser.EndElementHandler = self.handler.end_element
-        self.expat_parser.CharacterDataHandler = self.handler.char_data
-        self.expat_parser.StartNamespaceDeclHandler = self.handler.start_namespace
-        self.expat_parser.EndNamespaceDeclHandler = self.handler.end_namespace
-        self.expat_parser.Parse(source)
+        self._prep_parse().Parse(source, True)
+        return self._finish_parse()
+
+    def parse_file(self, fp, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        Parse XML from a file-like object, read chunk_size at a time
+        '''
+        feed_chunks(self._prep_parse(buffer_size=chunk_size), read_chunks(fp, chunk_size))
+        return self._finish_parse()
+
+    def parse_chunks(self, chunks):
+        '''
+        Parse XML from an iterable of string or bytes chunks, e.g. from a network stream
+        '''
+        feed_chunks(self._prep_parse(), chunks)
+        return self._finish_parse()
+
+    def parse_stream(self, chunks):
+        '''
+        Parse a stream of concatenated XML documents, yielding the root of each as soon as it's complete
+
+        chunks - iterable of string or bytes chunks, split anywhere
+
+        In namespace-preserving mode one nstable is shared by all the documents in the stream
+        '''
+        self.reset()
+        completed = self._completed = []
+        try:
+            for _ in feed_stream(lambda encoding: expat_parser(self.handler, encoding=encoding), chunks):
+                while completed:
+                    root = completed.pop(0)
+                    if self._ns_aware: root.xml_namespaces = self.namespaces
+                    yield root
+        finally:
+            self._completed = None
+        return
+
+    def parse_many(self, sources):
+        '''
+        Parse each of an iterable of XML documents, yielding the root of each in turn.
+        Meant for large numbers of small documents, such as messages, for which per-parse setup adds up
+
+        >>> from amara3.uxml import xml
+        >>> b = xml.treebuilder()
+        >>> [ root.xml_value for root in b.parse_many(['<a>1</a>', '<b>2</b>']) ]
+        ['1', '2']
+        '''
+        buffer_size = SMALL_DOC_BUFFER_SIZE
+        for source in sources:
+            self._prep_parse(buffer_size=buffer_size).Parse(source, True)
+            yield self._finish_parse()
+
+
+class directtreebuilder(tree.treebuilder):
+    '''
+    Tree builder whose expat handlers create the nodes directly, with no intermediate
+    event tuples or coroutine. Fastest way to get a full tree from XML.
+    Adjacent character data is merged into single text nodes.
+
+    With pause_gc=True, cyclic garbage collection is paused during each parse. Trees have no reference cycles
+    (parents are weak references), so collections triggered by the burst of allocation are wasted work.
+    It's off by default, since the gc switch is process-wide: only use it where nothing else, such as
+    another thread, relies on gc at the same time, and the application doesn't manage gc itself.
+
+    >>> from amara3.uxml import xml
+    >>> b = xml.directtreebuilder()
+    >>> root = b.parse('<spam xmlns="urn:x"><eggs a="1">x</eggs></spam>')
+    >>> root.xml_encode()
+    '<spam><eggs a="1">x</eggs></spam>'
+    '''
+    def __init__(self, values=None, pause_gc=False):
+        tree.treebuilder.__init__(self, values=values)
+        self.pause_gc = pause_gc
+
+    def _make_handlers(self):
+        '''
+        Create the expat handler closures, once per builder, so that they and their
+        name memo are reused from one parse to the next
+        '''
+        values = self._values
+        #Memo of expat qualified names (namespace URI space local name) to local names
+        local_names = {}
+        new_element, new_text, weakref_ = tree.element, tree.text, weakref.ref
+        #Current parent & its child list are kept in a list for rebinding in the closures
+        state = self._state = [None, None]
+
+        def start_element(name, attrs):
+            local = local_names.get(name)
+            if local is None:
+                local = local_names[name] = name.rpartition(' ')[2]
+                if values is not None: local = local_names[name] = values.name(local)
+            if attrs:
+                new_attrs = {}
+                for aname, aval in attrs.items():
+                    alocal = local_names.get(aname)
+                    if alocal is None:
+                        alocal = local_names[aname] = aname.rpartition(' ')[2]
+                    new_attrs[alocal] = aval
+                if values is not None: new_attrs = values.attrs(new_attrs)
+            else:
+                new_attrs = attrs
+            parent = state[0]
+            elem = new_element(local, new_attrs)
+            if parent is not None:
+                elem._xml_parent = weakref_(parent)
+                state[1].append(elem)
+            else:
+                self._root = elem
+            state[0], state[1] = elem, elem.xml_children
+
+        def end_element(name):
+            parent = state[0].xml_parent
+            state[0] = parent
+            state[1] = parent.xml_children if parent is not None else None
+
+        def char_data(data):
+            parent = state[0]
+            if parent is not None:
+                state[1].append(new_text(data, parent))
+
+        self._handlers = (start_element, end_element, char_data)
+        return self._handlers
+
+    def _prep_parse(self, buffer_size=DEFAULT_CHUNK_SIZE):
+        self._root = None
+        self._parent = None
+        handlers = getattr(self, '_handlers', None) or self._make_handlers()
+        self._state[0] = self._state[1] = None
+        p = self.expat_parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+        p.buffer_text = True
+        p.buffer_size = buffer_size
+        p.StartElementHandler, p.EndElementHandler, p.CharacterDataHandler = handlers
+        return p
+
+    def _parse(self, p, source):
+        if not self.pause_gc:
+            p.Parse(source, True)
+            return self._root
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            p.Parse(source, True)
+        finally:
+            if gc_was_enabled: gc.enable()
         return self._root
 
+    def parse(self, source):
+        return self._parse(self._prep_parse(), source)
+
+    def parse_many(self, sources):
+        '''
+        Parse each of an iterable of XML documents, yielding the root of each in turn.
+        Meant for large numbers of small documents, such as messages, for which per-parse setup adds up
+        '''
+        for source in sources:
+            yield self._parse(self._prep_parse(buffer_size=SMALL_DOC_BUFFER_SIZE), source)
+
+
+# Lazy trees
+
+class lazy_element(tree.element):
+    '''
+    Element whose children are only built from the XML source when xml_children is first accessed
+    Name and attributes are available right away. Created by lazytreebuilder
+    '''
+    def __init__(self, name, attrs=None, parent=None, lazy=None):
+        tree.element.__init__(self, name, attrs, parent)
+        #(source, start offset, end offset, in-scope namespaces), or None once materialized
+        self._xml_lazy = lazy
+
+    @property
+    def xml_children(self):
+        if self._xml_lazy is not None:
+            source, start, end, namespaces = self._xml_lazy
+            self._xml_lazy = None
+            _lazy_scanner(source, self).scan(start, end, namespaces)
+        return self._xml_children
+
+    @xml_children.setter
+    def xml_children(self, children):
+        self._xml_lazy = None
+        self._xml_children = children
+
+    def __repr__(self):
+        if self._xml_lazy is not None:
+            return u'{{uxml.element ({0}) "{1}" not yet materialized}}'.format(hash(self), self.xml_name)
+        return tree.element.__repr__(self)
+
+    @property
+    def xml_materialized(self):
+        '''
+        True if the children of this element have been built
+        '''
+        return self._xml_lazy is None
+
+
+class _lazy_source(object):
+    '''
+    XML source as bytes (or mmap) shared by all the lazy elements of a document
+    '''
+    def __init__(self, data, encoding):
+        self.data = data
+        self.encoding = encoding
+
+
+WRAPPER_NAME = 'amara3.lazy.wrapper'
+
+class _lazy_scanner(object):
+    '''
+    Structural pass over a section of source which builds one level of lazy children
+
+    Only the direct children of the target get nodes, so deeper markup costs little more than raw expat.
+    '''
+    def __init__(self, source, target=None):
+        self._source = source
+        self._target = target
+        self._root = None
+        self._depth = 0
+        self._ns_stack = [{}]
+        self._parent = None
+        self._current = None
+        self._maybe_empty = False
+
+    def scan(self, start=0, end=None, namespaces=None):
+        '''
+        Scan source from start to end offsets
+        With no target, build the root element of the document, with lazy children
+        Otherwise the section is the target's own markup, and its children are built
+        '''
+        data = self._source.data
+        p = self._parser = xml.parsers.expat.ParserCreate(self._source.encoding, namespace_separator=' ')
+        p.buffer_text = True
+        p.StartElementHandler = self.start_element
+        p.EndElementHandler = self.end_element
+        p.CharacterDataHandler = self.char_data
+        p.StartNamespaceDeclHandler = self.start_namespace
+        p.EndNamespaceDeclHandler = self.end_namespace
+        if self._target is None:
+            #Full document; the root itself is depth 1, its children depth 2
+            self._child_depth = 2
+            self._base = 0
+            p.XmlDeclHandler = self.xml_decl
+            p.Parse(data, True)
+            return self._root
+        #Wrap the section so that namespaces declared by ancestors are in scope
+        self._target._xml_children = []
+        decls = ''.join(( ' xmlns{0}={1}'.format(':' + prefix if prefix else '', quoteattr(ns))
+                        for prefix, ns in (namespaces or {}).items() ))
+        encoding = self._source.encoding or 'utf-8'
+        prefix = '<{0}{1}>'.format(WRAPPER_NAME, decls).encode(encoding)
+        #Child depth counts the wrapper and the target's own start tag
+        self._child_depth = 3
+        self._base = start - len(prefix)
+        p.Parse(prefix, False)
+        p.Parse(data[start:end], False)
+        p.Parse('</{0}>'.format(WRAPPER_NAME).encode(encoding), True)
+        return self._target
+
+    def xml_decl(self, version, encoding, standalone):
+        #Deferred parses of subtrees won't see the XML declaration, so remember its encoding
+        if encoding and not self._source.encoding:
+            self._source.encoding = encoding
+
+    def start_namespace(self, prefix, ns):
+        namespaces = self._ns_stack[-1].copy()
+        namespaces[prefix] = ns
+        self._ns_stack.append(namespaces)
+
+    def end_namespace(self, prefix):
+        self._ns_stack.pop()
+
+    def start_element(self, name, attrs):
+        self._depth += 1
+        self._maybe_empty = False
+        if self._depth > self._child_depth: return
+        local = name.split()[-1]
+        new_attrs = {}
+        for aname, aval in attrs.items():
+            new_attrs[aname.split()[-1]] = aval
+        if self._depth == self._child_depth:
+            start = self._base + self._parser.CurrentByteIndex
+            new_element = lazy_element(local, new_attrs, lazy=(self._source, start, None, self._ns_stack[-1]))
+            self._parent.xml_append(new_element)
+            self._current = new_element
+            self._maybe_empty = True
+        elif self._target is None:
+            #Root element; its children are built in this same pass
+            self._root = self._parent = lazy_element(local, new_attrs)
+        else:
+            self._parent = self._target
+
+    def end_element(self, name):
+        if self._depth == self._child_depth:
+            ix = self._parser.CurrentByteIndex
+            elem = self._current
+            source, start, _, namespaces = elem._xml_lazy
+            data = self._source.data
+            end_start = self._base + ix
+            #For an empty element tag expat reports the end event positioned after the tag
+            if self._maybe_empty and data[end_start - 2:end_start] == b'/>':
+                elem.xml_children = []
+            else:
+                end = data.find(b'>', end_start) + 1
+                elem._xml_lazy = (source, start, end, namespaces)
+        self._depth -= 1
+
+    def char_data(self, data):
+        self._maybe_empty = False
+        if self._depth == self._child_depth - 1 and self._parent is not None:
+            self._parent.xml_append(data)
+
+
+#Byte signatures of encodings in which markup characters aren't single ASCII bytes (XML 1.0 appendix F)
+#UTF-32 byte order marks come first, since the UTF-16 LE one is a prefix of UTF-32 LE's
+_WIDE_SIGNATURES = (
+    (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'),
+    (b'<\x00?\x00', 'utf-16-le'), (b'\x00<\x00?', 'utf-16-be'),
+)
+_MARKUP_CHARS = '<>/="\''
+
+
+def _wide_encoding(data, encoding):
+    '''
+    Return the encoding of the source if it isn't ASCII compatible, otherwise None
+    '''
+    if encoding:
+        try:
+            return None if _MARKUP_CHARS.encode(encoding) == _MARKUP_CHARS.encode('ascii') else encoding
+        except LookupError:
+            #Leave it to expat to complain
+            return None
+    head = data[:4]
+    for signature, sniffed in _WIDE_SIGNATURES:
+        if head.startswith(signature):
+            return sniffed
+    return None
+
+
+class lazytreebuilder(object):
+    '''
+    Build trees from XML which are only materialized as far as they're accessed
+
+    One fast structural pass creates the root element and its children, but each of those
+    children is a lazy_element whose own children are only built, from the recorded source offsets,
+    upon first access to xml_children. Useful for reading a few fields from a large document.
+
+    The source is retained for as long as there are unmaterialized elements.
+    Internal DTD subset entities are not available to the deferred parse of subtrees.
+    Element boundaries are found by scanning the source bytes for markup characters, so sources in encodings
+    which aren't ASCII compatible, such as UTF-16, are transcoded to UTF-8 up front (copying any mmap into memory).
+
+    >>> from amara3.uxml import xml
+    >>> b = xml.lazytreebuilder()
+    >>> root = b.parse('<a><b><c>1</c></b><b><c>2</c></b></a>')
+    >>> root.xml_children[0].xml_materialized
+    False
+    >>> root.xml_children[1].xml_value
+    '2'
+    '''
+    def parse(self, source, encoding=None):
+        '''
+        source - XML as string, bytes or mmap object
+        encoding - override the encoding of the source, if bytes. Strings are always handled as UTF-8
+        '''
+        if isinstance(source, str):
+            source, encoding = source.encode('utf-8'), 'utf-8'
+        else:
+            wide = _wide_encoding(source, encoding)
+            if wide:
+                #The given encoding overrides any in the XML declaration
+                source, encoding = source[:].decode(wide).encode('utf-8'), 'utf-8'
+        return _lazy_scanner(_lazy_source(source, encoding)).scan()
@@ -6,10 +6,11 @@
 # -----------------------------------------------------------------------------
 
 import asyncio
+import collections
 import xml.parsers.expat
 
 from . import treeiter
-from .xml import expat_callbacks, ns_expat_callbacks
+from .xml import expat_callbacks, ns_expat_callbacks, expat_parser, feed_chunks, feed_stream, read_chunks, DEFAULT_CHUNK_SIZE
 
 
 def buffer_handler(accumulator):
@@ -33,22 +34,194 @@ class sender(treeiter.sender):
     >>> values
     ['1', '2', '3']
     '''
-    def __init__(self, pattern, sink, prime_sinks=True, callbacks=expat_callbacks):
-        super(sender, self).__init__(pattern, sink, prime_sinks=prime_sinks)
+    def __init__(self, pattern, sink, prime_sinks=True, callbacks=expat_callbacks, projections=None, fields=None):
+        super(sender, self).__init__(pattern, sink, prime_sinks=prime_sinks, projections=projections, fields=fields)
         self.handler = callbacks(self._handler())
-        self.expat_parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
-
-        self.expat_parser.StartElementHandler = self.handler.start_element
-        self.expat_parser.EndElementHandler = self.handler.end_element
-        self.expat_parser.CharacterDataHandler = self.handler.char_data
-        self.expat_parser.StartNamespaceDeclHandler = self.handler.start_namespace
-        self.expat_parser.EndNamespaceDeclHandler = self.handler.end_namespace
+        self.expat_parser = expat_parser(self.handler)
         return
 
     def parse(self, source):
         self.expat_parser.Parse(source)
         return
 
-    def parse_file(self, fp):
-        self.expat_parser.ParseFile(fp)
+    def parse_file(self, fp, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        Parse XML from a file-like object, read chunk_size at a time
+        '''
+        feed_chunks(self.expat_parser, read_chunks(fp, chunk_size))
+        return
+
+    def parse_chunks(self, chunks):
+        '''
+        Parse XML from an iterable of string or bytes chunks
+        '''
+        feed_chunks(self.expat_parser, chunks)
+        return
+
+    def parse_stream(self, chunks):
+        '''
+        Parse a stream of concatenated XML documents, given as an iterable of string or bytes chunks.
+        Patterns are matched against each document in turn
+        '''
+        def new_parser(encoding):
+            self.expat_parser = expat_parser(self.handler, encoding=encoding)
+            return self.expat_parser
+        for _ in feed_stream(new_parser, chunks):
+            pass
+        return
+
+
+def iterparse(source, pattern, chunk_size=DEFAULT_CHUNK_SIZE, callbacks=expat_callbacks, projection=None, fields=None):
+    '''
+    Parse XML, yielding each subtree matching the pattern, as soon as the chunk
+    of input containing its end tag has been parsed. Subtrees are not otherwise retained,
+    so each can be reclaimed once the caller is done with it, and input is only read
+    as far as the caller consumes results, e.g. with itertools.islice
+
+    source - XML text, a file-like object (read chunk_size at a time) or an iterable of string or bytes chunks
+    pattern - as for sender, or a MicroXPath string as accepted by uxpath.compile_pattern
+    callbacks - expat callbacks class, e.g. ns_expat_callbacks to preserve namespaces
+    projection - optional projection for the pattern, as for treeiter.sender
+    fields - optional field map for the pattern, as for treeiter.sender, in which case records are yielded rather than subtrees
+
+    >>> from amara3.uxml import xmliter
+    >>> with open('records.xml', 'rb') as fp:
+    ...     for record in xmliter.iterparse(fp, '//record'):
+    ...         print(record.xml_attributes['id'])
+    '''
+    if isinstance(pattern, str):
+        from .uxpath import compile_pattern
+        pattern = compile_pattern(pattern)
+    matches = collections.deque()
+    ts = sender(pattern, treeiter._collector(matches), callbacks=callbacks, projections=projection, fields=fields)
+    p = ts.expat_parser
+    for chunk in treeiter._source_chunks(source, chunk_size):
+        p.Parse(chunk, False)
+        while matches:
+            yield matches.popleft()
+    p.Parse(b'', True)
+    while matches:
+        yield matches.popleft()
+    return
+
+
+DEFAULT_QUEUE_SIZE = 64
+
+
+def _tagged_collector(matches, ix):
+    '''
+    Sink which queues up what it's sent, tagged with the index of its pattern
+    '''
+    while True:
+        matches.append((ix, (yield)))
+
+
+async def _async_chunks(source, chunk_size):
+    '''
+    Yield chunks from XML text, an object with an async read() method, such as asyncio.StreamReader,
+    or an async or plain iterable of string or bytes chunks
+    '''
+    if isinstance(source, (str, bytes)):
+        yield source
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = await source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    elif hasattr(source, '__aiter__'):
+        async for chunk in source:
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+class async_sender(object):
+    '''
+    Asyncio counterpart of sender, reading from an async source and awaiting async sinks
+
+    Matches go through a bounded queue to the sinks, so if they fall behind, parsing,
+    and therefore reading from the source, waits for them to catch up
+
+    >>> import asyncio
+    >>> from amara3.uxml import xmliter
+    >>> async def store(record):
+    ...     await db.insert(record.xml_attributes['id'], record.xml_value)
+    ...
+    >>> async def main():
+    ...     reader, writer = await asyncio.open_connection('feeds.example.com', 8000)
+    ...     await xmliter.async_sender(('db', 'record'), store).parse(reader)
+    '''
+    def __init__(self, patterns, sinks, queue_size=DEFAULT_QUEUE_SIZE, executor=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, callbacks=expat_callbacks, projections=None, fields=None):
+        '''
+        patterns - pattern or list of patterns, as for treeiter.sender
+        sinks - async function, or list of them corresponding to the patterns, each to be awaited with each match
+        queue_size - maximum number of matches waiting for the sinks
+        executor - optional concurrent.futures executor in which to parse each chunk, so that the event loop
+            isn't held up parsing. A ThreadPoolExecutor is the natural choice, since the parser can't be shared across processes
+        chunk_size - size of pieces read from sources with a read() method
+        callbacks, projections, fields - as for sender
+        '''
+        self._patterns = patterns
+        self._sinks = sinks if isinstance(sinks, (list, tuple)) else [sinks]
+        self._queue_size = queue_size
+        self._executor = executor
+        self._chunk_size = chunk_size
+        self._callbacks = callbacks
+        self._projections = projections
+        self._fields = fields
+        return
+
+    async def _consume(self, queue, failed):
+        error = None
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            #After a sink error, keep emptying the queue so that the parse isn't left waiting
+            if error is None:
+                ix, match = item
+                try:
+                    await self._sinks[ix](match)
+                except Exception as e:
+                    error = e
+                    failed.append(e)
+        if error is not None:
+            raise error
+        return
+
+    async def parse(self, source):
+        '''
+        Parse XML from a string, an object with an async read() method, or an async or plain iterable of string or bytes chunks
+        '''
+        matches = collections.deque()
+        ts = sender(self._patterns, [ _tagged_collector(matches, ix) for ix in range(len(self._sinks)) ],
+                    callbacks=self._callbacks, projections=self._projections, fields=self._fields)
+        p = ts.expat_parser
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self._queue_size)
+        failed = []
+        consumer = asyncio.ensure_future(self._consume(queue, failed))
+
+        async def feed(chunk, final):
+            if self._executor is None:
+                p.Parse(chunk, final)
+            else:
+                await loop.run_in_executor(self._executor, p.Parse, chunk, final)
+            while matches:
+                await queue.put(matches.popleft())
+
+        try:
+            async for chunk in _async_chunks(source, self._chunk_size):
+                await feed(chunk, False)
+                if failed: break
+            else:
+                await feed(b'', True)
+            await queue.put(None)
+            await consumer
+        except BaseException:
+            consumer.cancel()
+            raise
         return
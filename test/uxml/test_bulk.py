@@ -0,0 +1,97 @@
+'''
+py.test test/uxml/test_bulk.py
+'''
+
+import os
+import tempfile
+import concurrent.futures
+
+import pytest
+from amara3.uxml import tree, treeutil, xmliter, bulk
+
+
+DOCS = [
+    '<a x="1"><b>c</b>d<e></e></a>',
+    '<monty><python spam="eggs">What do you mean "bleh"</python></monty>',
+    '<x>é<y z="&lt;"></y></x>',
+]
+
+
+def count_elements(root):
+    return len(list(treeutil.select_elements(treeutil.descendants(root))))
+
+
+@pytest.fixture
+def docpaths():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for i, doc in enumerate(DOCS * 5):
+            path = os.path.join(tmpdir, 'doc{0}.xml'.format(i))
+            with open(path, 'w', encoding='utf-8') as fp:
+                fp.write(doc)
+            paths.append(path)
+        yield paths
+
+
+def test_dumps_loads():
+    for doc in DOCS:
+        root = tree.parse(doc)
+        rebuilt = bulk.loads(bulk.dumps(root))
+        assert rebuilt.xml_encode() == root.xml_encode()
+        assert rebuilt.xml_children[0].xml_parent is rebuilt
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_parse_many_ordered(docpaths, workers):
+    results = list(bulk.parse_many(docpaths, workers=workers, batch_size=4))
+    assert [ path for path, root in results ] == docpaths
+    expected = [ tree.parse(doc).xml_encode() for doc in DOCS * 5 ]
+    assert [ root.xml_encode() for path, root in results ] == expected
+
+
+def test_parse_many_func_unordered(docpaths):
+    results = dict(bulk.parse_many(docpaths, workers=2, backend='microxml',
+                                    func=count_elements, ordered=False, batch_size=3))
+    assert results == { path: count_elements(tree.parse(doc))
+                        for path, doc in zip(docpaths, DOCS * 5) }
+
+
+def test_parse_many_window(docpaths):
+    #One batch in flight at a time
+    results = list(bulk.parse_many(docpaths, workers=2, batch_size=2, window=1))
+    assert [ path for path, root in results ] == docpaths
+    results = dict(bulk.parse_many(docpaths, workers=2, func=count_elements, ordered=False, batch_size=2, window=2))
+    assert set(results) == set(docpaths)
+
+
+def test_parse_many_errors(docpaths):
+    with open(docpaths[0], 'w') as fp:
+        fp.write('<a>')
+    results = list(bulk.parse_many(docpaths, workers=0, return_exceptions=True))
+    assert isinstance(results[0][1], Exception)
+    assert all(isinstance(root, tree.element) for path, root in results[1:])
+    with pytest.raises(Exception):
+        list(bulk.parse_many(docpaths, workers=0))
+
+
+def slow_value(elem):
+    #Later items finish first, to exercise the re-sequencing
+    import time
+    time.sleep(0.001 * (10 - int(elem.xml_attributes['id']) % 10))
+    return elem.xml_value
+
+
+@pytest.mark.parametrize('executor_class', [concurrent.futures.ThreadPoolExecutor, concurrent.futures.ProcessPoolExecutor])
+def test_dispatch(executor_class):
+    doc = '<db>' + ''.join('<r id="{0}">{0}</r>'.format(i) for i in range(50)) + '</db>'
+    pulled = []
+    def subtrees():
+        for e in xmliter.iterparse(doc, ('db', 'r')):
+            pulled.append(e)
+            yield e
+
+    with executor_class(2) as executor:
+        results = bulk.dispatch(subtrees(), slow_value, executor, window=4)
+        assert next(results) == '0'
+        assert len(pulled) <= 4
+        assert list(results) == [ str(i) for i in range(1, 50) ]
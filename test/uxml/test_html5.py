@@ -4,6 +4,7 @@ py.test test/uxml/test_tree.py
 
 import sys
 import io
+import gc
 import logging
 from asyncio import coroutine
 
@@ -11,6 +12,7 @@ import pytest #Consider also installing pytest_capturelog
 from amara3.uxml import tree
 from amara3.uxml.tree import node, element
 from amara3.uxml import html5
+from amara3.uxml import html5iter
 
 
 DOC1 = '<html><head><title>HELLO</title></head><body><p>WORLD</body></html>'
@@ -34,5 +36,87 @@ def test_basic_nav(doc):
         assert elem.xml_parent is root, (elem, root)
 
 
+def test_misnested_formatting():
+    #Exercises html5lib's adoption agency, which clones elements
+    root = html5.parse(io.StringIO('<b><p>x</b>y'))
+    assert root.xml_encode() == '<html><head></head><body><b></b><p><b>x</b>y</p></body></html>'
+
+
+def test_stream_limitations():
+    #Where streaming departs from html5.parse (see html5iter module docs). No adoption agency:
+    root, = html5iter.iterparse('<b><p>x</b>y', ('html',))
+    assert root.xml_encode() == '<html><head></head><body><b><p>x</p></b>y</body></html>'
+    #Attributes of a repeated body start tag are not merged
+    root, = html5iter.iterparse('<body a=1><p>x<body b=2>', ('html',))
+    assert root.xml_encode() == '<html><head></head><body a="1"><p>x</p></body></html>'
+    #Legacy doctypes don't give quirks mode, so the table closes the paragraph
+    doc = '<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN"><p>x<table></table>'
+    root, = html5iter.iterparse(doc, ('html',))
+    assert root.xml_encode() == '<html><head></head><body><p>x</p><table></table></body></html>'
+
+
+STREAM_CASES = [
+    DOC1,
+    '<title>x</title><p>1<p>2',
+    '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><style>p > a {}</style></head>\n'
+    '<body><ul><li>1<li>2</ul><table><tr><td>a<td>b<tr><td>c</table><br>x<img src=y>z</body></html>\n',
+    'text only',
+    '<p>a</p></p><script>if (a<b) x="</p>";</script>',
+    '<dl><dt>a<dd>b<dt>c</dl><select><option>1<option>2</select>',
+    '<p><li>x<dd>y<dt>z',
+    '<h1>a<h2>b</h2>c',
+    '<a href=1>x<a href=2>y</a><button>b<button>c</button>',
+    '<pre>\nx\n</pre><listing>\n\ny</listing><textarea>\nz</textarea>',
+    '<frameset><frame src=a></frameset>',
+    '<p><image src=x><svg><image href=y></image><circle r=1 /></svg>',
+    #Quirks mode, without a doctype, where a table doesn't close a paragraph, & no-quirks mode, where it does
+    '<p>x<table><tr><td>1</table>',
+    '<!DOCTYPE html><p>x<table><tr><td>1</table>',
+    #Table parts outside a table are ignored
+    '<td>x</td><tr><p>y<caption>z<col><tbody>w',
+]
+
+
+@pytest.mark.parametrize('doc', STREAM_CASES)
+def test_stream_matches_tree(doc):
+    streamed = list(html5iter.iterparse(doc, ('html',)))
+    assert len(streamed) == 1
+    assert streamed[0].xml_encode() == html5.parse(io.StringIO(doc)).xml_encode()
+
+
+def test_stream_sender():
+    values = []
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_value)
+
+    ts = html5iter.sender(('html', 'body', 'ul', 'li'), sink(values))
+    ts.parse(io.BytesIO(b'<meta charset="utf-8"><ul><li>1<li>2</ul><ul><li>\xc3\xa9</ul>'))
+    assert values == ['1', '2', 'é']
+
+
+def test_stream_iterparse():
+    doc = '<p><a href="x">1</a><p><a href="y">2</a>'
+    assert [ e.xml_attributes['href'] for e in html5iter.iterparse(doc, '//a') ] == ['x', 'y']
+    assert [ e.xml_attributes['href'] for e in html5iter.iterparse(doc, '//p/a') ] == ['x', 'y']
+
+
+def test_slim_elements():
+    root = html5.parse(io.StringIO('<p class="x">a<p>b<svg><circle></circle></svg>'))
+    paras = [ e for e in root.xml_children[1].xml_children ]
+    assert [ p.name for p in paras ] == ['p', 'p']
+    #Elements share their html5lib name tuples, and don't allocate instance dicts
+    assert paras[0].nameTuple is paras[1].nameTuple
+    #Element names also come from the shared tuples (single characters such as 'p' are shared anyway)
+    divs = html5.parse(io.StringIO('<div>a</div><div>b</div>')).xml_children[1].xml_children
+    assert divs[0].xml_name is divs[1].xml_name
+    assert paras[0].namespace == html5.XHTML_NAMESPACE
+    for p in paras:
+        assert not hasattr(p, '_flags')
+        #Looking up __dict__ would create it, so check what the element refers to instead
+        assert [ r for r in gc.get_referents(p) if isinstance(r, dict) ] == [p.xml_attributes]
+
+
 if __name__ == '__main__':
     raise SystemExit("Run with py.test")
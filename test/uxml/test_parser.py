@@ -125,3 +125,24 @@ def test_feed_frags1(docfrag, events):
     p.close()
     h.close()
     assert acc == events
+
+
+@pytest.mark.parametrize('docfrag,events', zip(alldocfrags, allexpectedev))
+def test_multidoc(docfrag, events):
+    acc = []
+    h = handler(acc)
+    p = parser(h, multidoc=True)
+    #Same document three times over, in one stream
+    for frag in list(docfrag) * 3:
+        p.send((frag, False))
+    p.send(('', True))
+    p.close()
+    h.close()
+    assert acc == events * 3
+
+
+def test_junk_after_doc():
+    acc = []
+    p = parser(handler(acc))
+    with pytest.raises(RuntimeError):
+        p.send(('<a></a><b></b>', True))
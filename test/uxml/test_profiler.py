@@ -0,0 +1,64 @@
+'''
+py.test test/uxml/test_profiler.py
+'''
+
+import io
+
+from amara3.uxml import profiler
+
+
+DOC = '<db><record id="1"><name>Alex</name></record><record id="2"><name>Bob</name><x a="q"></x></record></db>'
+
+
+def test_profile():
+    prof = profiler.profiler()
+    prof.parse(io.BytesIO(DOC.encode('utf-8')), chunk_size=10)
+    report = prof.report()
+    assert report['documents'] == 1
+    assert report['elements'] == 6
+    assert report['max_depth'] == 3
+    assert report['depths'] == {1: 1, 2: 2, 3: 3}
+    assert report['names'] == {'record': 2, 'name': 2, 'db': 1, 'x': 1}
+    assert report['paths']['/db/record/name'] == {'count': 2, 'text_count': 2, 'text_chars': 7, 'text_max': 4}
+    assert report['paths']['/db/record/x']['text_count'] == 0
+    assert report['attributes']['/db/record/@id'] == {'count': 2, 'distinct': 2, 'distinct_exact': True}
+
+    #Same again, via the MicroXML parser, accumulating over both documents
+    prof.parse_microxml([DOC[:20], DOC[20:]])
+    report = prof.report()
+    assert report['documents'] == 2
+    assert report['paths']['/db/record']['count'] == 4
+    assert report['attributes']['/db/record/@id']['distinct'] == 2
+
+
+def test_profile_bounds():
+    doc = '<db>' + ''.join('<r id="{0}"><f{1}></f{1}></r>'.format(i, i % 50) for i in range(20000)) + '</db>'
+    prof = profiler.profiler(max_paths=12, sketch_size=128)
+    prof.parse(doc)
+    report = prof.report()
+    assert len(report['paths']) == 12
+    assert report['untracked_elements'] == 20000 - 20000 // 50 * 10
+    ids = report['attributes']['/db/r/@id']
+    assert ids['count'] == 20000
+    assert not ids['distinct_exact']
+    assert 12000 < ids['distinct'] < 30000
+
+
+def test_profile_name_attribute_bounds():
+    doc = '<db>' + ''.join('<n{0} a{0}="x"></n{0}>'.format(i) for i in range(100)) + '</db>'
+    prof = profiler.profiler(max_names=10, max_attributes=5)
+    prof.parse(doc)
+    report = prof.report()
+    assert len(report['names']) == 10
+    assert report['untracked_names'] == 101 - 10
+    assert len(report['attributes']) == 5
+    assert report['untracked_attributes'] == 100 - 5
+    assert report['elements'] == 101
+
+
+def test_sketch():
+    s = profiler.sketch(k=16)
+    for i in range(10):
+        s.add(str(i))
+        s.add(str(i))
+    assert s.exact and s.estimate() == 10
@@ -47,5 +47,81 @@ def test_basic_mutate(doc):
     #FIXME: More testing
 
 
+@pytest.mark.parametrize('doc', DOC_CASES)
+def test_bulk_mutate(doc):
+    tb = tree.treebuilder()
+    root = tb.parse(doc)
+    orig_count = len(root.xml_children)
+    new_elems = [element('dee'), element('dum'), 'text']
+    root.xml_extend(new_elems)
+    assert len(root.xml_children) == orig_count + 3
+    assert root.xml_children[-1] == 'text'
+    assert isinstance(root.xml_children[-1], tree.text)
+    for child in root.xml_children[-3:]:
+        assert child.xml_parent is root
+    #All the adopted nodes share a single parent weakref
+    assert root.xml_children[-3]._xml_parent is root.xml_children[-1]._xml_parent
+
+    removed = root.xml_remove_range(orig_count, orig_count + 2)
+    assert [ e.xml_name for e in removed ] == ['dee', 'dum']
+    assert all(( e.xml_parent is None for e in removed ))
+    assert len(root.xml_children) == orig_count + 1
+
+    old_children = root.xml_children
+    root.xml_replace_children(removed)
+    assert root.xml_children == removed
+    assert all(( e.xml_parent is root for e in removed ))
+    assert all(( e.xml_parent is None for e in old_children ))
+
+    dee = removed[0].xml_detach()
+    assert dee.xml_parent is None
+    assert root.xml_children == [removed[1]]
+
+
+def test_detach_by_identity():
+    root = tree.parse('<a><b></b>x<c></c>x</a>')
+    second_x = root.xml_children[3]
+    second_x.xml_detach()
+    assert [ str(ch) for ch in root.xml_children if isinstance(ch, tree.text) ] == ['x']
+    assert root.xml_children[1] is not second_x
+
+
+@pytest.mark.parametrize('doc', DOC_CASES)
+def test_clone(doc):
+    root = tree.parse(doc)
+    copy = root.xml_clone()
+    assert copy is not root
+    assert copy.xml_parent is None
+    assert copy.xml_encode() == root.xml_encode()
+    orig_b, copy_b = root.xml_children[0], copy.xml_children[0]
+    assert copy_b is not orig_b
+    assert copy_b.xml_parent is copy
+    assert copy_b.xml_name is orig_b.xml_name
+    copy_b.xml_append('extra')
+    assert copy.xml_encode() != root.xml_encode()
+
+    shallow = root.xml_clone(deep=False)
+    assert shallow.xml_children == []
+    assert shallow.xml_name == root.xml_name
+
+
+def test_valuetable():
+    values = tree.valuetable(threshold=5)
+    root1 = tree.treebuilder(values=values).parse('<a s="ok" l="toolong"><b s="ok"></b></a>')
+    root2 = tree.treebuilder(values=values).parse('<b s="ok" l="toolong"></b>')
+    b1 = root1.xml_children[0]
+    assert b1.xml_name is root2.xml_name
+    assert root1.xml_attributes['s'] is b1.xml_attributes['s'] is root2.xml_attributes['s']
+    assert root1.xml_attributes['l'] is not root2.xml_attributes['l']
+    assert root1.xml_encode() == '<a s="ok" l="toolong"><b s="ok"></b></a>'
+
+
+def test_parse_stream():
+    frags = [ DOC1[:5], DOC1[5:] + ' \n' + DOC2[:3], DOC2[3:] + DOC3 ]
+    roots = list(tree.treebuilder().parse_stream(frags))
+    assert [ r.xml_encode() for r in roots ] == [DOC1, DOC2, DOC3]
+    assert all(( r.xml_parent is None for r in roots ))
+
+
 if __name__ == '__main__':
     raise SystemExit("Run with py.test")
@@ -56,5 +56,166 @@ def test_ts_basics():
     return
 
 
+def test_ts_stream():
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_value)
+
+    values = []
+    ts = treeiter.sender(('a', 'b'), sink(values))
+    ts.parse_stream([DOC1, DOC1[:7], DOC1[7:] + DOC2])
+    assert values == ['1', '2', '3'] * 2 + ['1']
+
+
+def test_ts_multiple_patterns():
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_value)
+
+    xvalues, cvalues, yvalues = [], [], []
+    ts = treeiter.sender([('a', '**', 'x'), ('a', 'c'), ('a', 'y')],
+                            [sink(xvalues), sink(cvalues), sink(yvalues)])
+    ts.parse(DOC4)
+    assert xvalues == ['1', '2', '3', '4']
+    assert cvalues == ['23']
+    assert yvalues == ['5']
+
+
+def test_ts_many_patterns():
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_value)
+
+    #Hundreds of patterns, most of which never match
+    names = [ 'n{0}'.format(i) for i in range(300) ] + ['x']
+    patterns = [ ('a', '**', name) for name in names ]
+    accumulators = [ [] for name in names ]
+    ts = treeiter.sender(patterns, [ sink(acc) for acc in accumulators ])
+    ts.parse(DOC3)
+    assert accumulators[-1] == ['1', '2', '3', '4']
+    assert not any(accumulators[:-1])
+
+    #'**' explores every nesting, rather than committing to the first candidate
+    values = []
+    ts = treeiter.sender(('a', '**', 'b', 'c'), sink(values))
+    ts.parse('<a><b><x><b><c>1</c></b></x></b></a>')
+    assert values == ['1']
+
+
+def test_ts_attribute_steps():
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_value)
+
+    DOC = '<c><r type="book" id="1">A</r><r type="cd">B</r><r>C</r><s type="book" id="4">D</s></c>'
+    step = treeiter.step
+
+    cases = [
+        (('c', step('r', {'type': 'book'})), ['A']),
+        (('c', step('r', {'type': True})), ['A', 'B']),
+        (('c', step('*', {'type': 'book'})), ['A', 'D']),
+        (('c', step('*', {'id': lambda v: int(v) > 1})), ['D']),
+        (('c', step('r')), ['A', 'B', 'C']),
+        (('**', step('r', {'type': 'book', 'id': '1'})), ['A']),
+        (('c', (step('r', {'type': 'cd'}), 's')), ['B', 'D']),
+    ]
+    for pattern, expected in cases:
+        values = []
+        ts = treeiter.sender(pattern, sink(values))
+        ts.parse(DOC)
+        assert values == expected, pattern
+
+    #Attribute steps alongside plain name patterns
+    books, records = [], []
+    ts = treeiter.sender([('c', step('r', {'type': 'book'})), ('c', 'r')], [sink(books), sink(records)])
+    ts.parse(DOC)
+    assert books == ['A']
+    assert records == ['A', 'B', 'C']
+
+
+def test_iterparse():
+    assert [ e.xml_value for e in treeiter.iterparse(DOC1, ('a', 'b')) ] == ['1', '2', '3']
+    frags = [ DOC3[i:i+5] for i in range(0, len(DOC3), 5) ]
+    assert [ e.xml_value for e in treeiter.iterparse(frags, ('a', '**', 'x')) ] == ['1', '2', '3', '4']
+
+
+def test_projection():
+    from amara3.uxml import treeutil
+    fields = ''.join('<f{0}>v{0}</f{0}>'.format(i) for i in range(40))
+    doc = '<db>' + '<r id="1"><title>A</title><author><name>X</name><born>1900</born></author>{0}</r>'.format(fields) * 3 + '</db>'
+
+    full = list(treeiter.iterparse(doc, ('db', 'r')))
+    projected = list(treeiter.iterparse(doc, ('db', 'r'), projection=['title', 'author/name']))
+    assert [ e.xml_encode() for e in projected ] == ['<r id="1"><title>A</title><author><name>X</name></author></r>'] * 3
+    assert treeutil.tree_stats(projected[0])['elements'] * 10 < treeutil.tree_stats(full[0])['elements']
+
+    projected = list(treeiter.iterparse(doc, ('db', 'r'), projection=[('author', '*'), 'author/name', 'f39']))
+    assert [ e.xml_encode() for e in projected ] == ['<r id="1"><author><name>X</name><born>1900</born></author><f39>v39</f39></r>'] * 3
+
+    #Wildcard paths apply alongside named ones
+    projected = list(treeiter.iterparse(doc, ('db', 'r'), projection=['author/name', '*/born', '*']))
+    assert [ e.xml_encode() for e in projected ] == [ e.xml_encode() for e in full ]
+    #Other children of r are on the '*/born' path, so they're kept, but without their text
+    projected = list(treeiter.iterparse(doc, ('db', 'r'), projection=['author/name', '*/born']))
+    for e in projected:
+        assert e.xml_encode().startswith('<r id="1"><title></title><author><name>X</name><born>1900</born></author><f0></f0>')
+
+    #Projections per pattern, alongside a pattern without one
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_encode())
+    titles, authors = [], []
+    ts = treeiter.sender([('db', 'r'), ('db', 'r', 'author')], [sink(titles), sink(authors)],
+                            projections=['title', None])
+    ts.parse(doc)
+    assert titles == ['<r id="1"><title>A</title></r>'] * 3
+    assert authors == ['<author><name>X</name><born>1900</born></author>'] * 3
+
+
+FIELDS_DOC = '<db><r id="1" n="3"><title>A<i>x</i>B</title><author><name>X</name></author><title>Z</title></r><r id="2" n="4"><author></author></r></db>'
+
+def test_fields():
+    spec = {'id': '@id', 'title': 'title/text()', 'full': 'title', 'name': 'author/name', 'all': '.', 'n': 'author/name/text()'}
+    records = list(treeiter.iterparse(FIELDS_DOC, ('db', 'r'), fields=spec))
+    assert records == [
+        {'id': '1', 'title': 'AB', 'full': 'AxB', 'name': 'X', 'all': 'AxBXZ', 'n': 'X'},
+        {'id': '2', 'title': None, 'full': None, 'name': None, 'all': '', 'n': None},
+    ]
+
+    fm = treeiter.fieldmap({'id': '@id', 'name': '*/name'}, output='tuple')
+    assert list(treeiter.iterparse(FIELDS_DOC, ('db', 'r'), fields=fm)) == [('1', 'X'), ('2', None)]
+
+    #Named & wildcard paths through the same element
+    fm = treeiter.fieldmap({'an': 'author/name', 'ag': '*/age', 'n': '*/name/text()'}, output='tuple')
+    doc = '<db><r><author><name>X</name><age>3</age></author></r></db>'
+    assert list(treeiter.iterparse(doc, ('db', 'r'), fields=fm)) == [('X', '3', 'X')]
+
+    #text() takes the first matching element with child text, while an element's string value may be empty
+    fm = treeiter.fieldmap({'t': 'title/text()', 'v': 'title', 'm': 'x/text()'}, output='tuple')
+    doc = '<db><r><title></title><title>x</title><x></x></r></db>'
+    assert list(treeiter.iterparse(doc, ('db', 'r'), fields=fm)) == [('x', '', None)]
+
+    fm = treeiter.fieldmap({'id': '@id', 'n': '@n'}, output='columns', batch_size=1, typecodes={'n': 'l'})
+    batches = list(treeiter.iterparse(FIELDS_DOC, ('db', 'r'), fields=fm))
+    assert [ b['id'] for b in batches ] == [['1'], ['2']]
+    assert list(batches[1]['n']) == [4]
+
+    #Partial batches are sent at the end of each document
+    def sink(accumulator):
+        while True:
+            accumulator.append((yield))
+    batches, subtrees = [], []
+    fm = treeiter.fieldmap({'id': '@id', 'n': '@n'}, output='columns', batch_size=3, typecodes={'n': 'd'})
+    ts = treeiter.sender([('db', 'r'), ('db', 'r', 'author')], [sink(batches), sink(subtrees)], fields=[fm, None])
+    ts.parse_stream([FIELDS_DOC, FIELDS_DOC])
+    assert [ (b['id'], list(b['n'])) for b in batches ] == [(['1', '2'], [3.0, 4.0])] * 2
+    assert [ e.xml_encode() for e in subtrees ] == ['<author><name>X</name></author>', '<author></author>'] * 2
+
+
 if __name__ == '__main__':
     raise SystemExit("Run with py.test")
@@ -28,5 +28,57 @@ def test_make_pretty(doc, dep, ind, expected):
     assert root.xml_encode() == expected
 
 
+def test_tree_stats():
+    root = tree.parse('<a x="1" y="2"><b>1</b><c><b>22</b></c>é</a>')
+    stats = tree_stats(root)
+    assert stats['elements'] == 4
+    assert stats['texts'] == 3
+    assert stats['attributes'] == 2
+    assert stats['max_depth'] == 4
+    assert stats['names'] == 3
+    assert stats['text_bytes'] == 5
+    assert set(stats['memory_by_name']) == {'a', 'b', 'c'}
+    assert stats['memory'] == sum(stats['memory_by_type'].values())
+    assert stats['memory'] == sum(stats['memory_by_name'].values())
+
+
+def test_traced_parse():
+    root, allocated, peak = traced_parse(DOC4)
+    assert root.xml_name == 'a'
+    assert 0 < allocated <= peak
+
+
+def test_subtree_hash():
+    root1 = tree.parse(DOC4)
+    root2 = tree.parse(DOC4.replace('<x>3</x>', '<x>three</x>'))
+    assert subtree_hash(root1) != subtree_hash(root2)
+    assert subtree_hash(root1.xml_children[0]) == subtree_hash(root2.xml_children[0])
+    #Attribute order and text splitting don't matter
+    assert subtree_hash(tree.parse('<a x="1" y="2">b</a>')) == subtree_hash(tree.parse('<a y="2" x="1">b</a>'))
+    split = tree.parse('<a>bc</a>')
+    split.xml_replace_children(['b', 'c'])
+    assert subtree_hash(split) == subtree_hash(tree.parse('<a>bc</a>'))
+
+
+def test_subtree_hash_invalidation():
+    root = tree.parse(DOC4)
+    orig_hash = subtree_hash(root)
+    assert root._xml_hash == orig_hash
+    x = root.xml_children[1].xml_children[1].xml_children[0]
+    x.xml_append('0')
+    assert root._xml_hash is None
+    assert subtree_hash(root) != orig_hash
+    x.xml_remove_range(1)
+    assert subtree_hash(root) == orig_hash
+
+
+def test_diff_children():
+    old = tree.parse(DOC4)
+    new = tree.parse('<a><b><x>1</x></b><x>4</x><y>five</y><z></z></a>')
+    diffs = [ (tag, [ e.xml_name for e in o ], [ e.xml_name for e in n ])
+                for (tag, o, n) in diff_children(old, new) ]
+    assert diffs == [('delete', ['c'], []), ('replace', ['y'], ['y', 'z'])]
+
+
 if __name__ == '__main__':
     raise SystemExit("Run with py.test")
@@ -8,7 +8,8 @@ import gc
 import pytest
 from amara3.uxml import tree
 from amara3.uxml.tree import node, text, element
-from amara3.uxml.uxpath import context, parse as uxpathparse
+from amara3.uxml.uxpath import context, parse as uxpathparse, compile_pattern
+from amara3.uxml import treeiter
 
 #from amara3.util import coroutine
 
@@ -134,5 +135,35 @@ def test_expressions(path, top, expected):
     assert tresult == expected, (tresult, expected)
 
 
+STREAM_DOC = '<db><record status="active" id="1"><item>a</item><item>b</item></record><record id="2"><item>c</item></record><x><record status="active"><item>d</item></record></x></db>'
+
+STREAM_CASES = [
+    ("//record[@status='active']/item", ['a', 'b', 'd']),
+    ('/db/record/item', ['a', 'b', 'c']),
+    ('db/record[@id]', ['ab', 'c']),
+    ("//*[@id='2']", ['c']),
+    ('db//item', ['a', 'b', 'c', 'd']),
+    ("descendant::record[@status and @id='1']/child::item", ['a', 'b']),
+]
+
+@pytest.mark.parametrize('path,expected', STREAM_CASES)
+def test_compile_pattern(path, expected):
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_value)
+
+    streamed = []
+    ts = treeiter.sender(compile_pattern(path), sink(streamed))
+    ts.parse(STREAM_DOC)
+    assert streamed == expected
+
+
+@pytest.mark.parametrize('path', ['//a[1]', 'a/text()', 'a/..', 'a | b', '//@id', "a[@x='1'][@x='2']"])
+def test_compile_pattern_unsupported(path):
+    with pytest.raises(ValueError):
+        compile_pattern(path)
+
+
 if __name__ == '__main__':
     raise SystemExit("Run with py.test")
@@ -1,6 +1,6 @@
 import io
 import pytest
-from amara3.uxml import writer
+from amara3.uxml import writer, xml
 
 
 def test_raw_basics():
@@ -21,5 +21,20 @@ def Xtest_raw_namespacer():
     assert fp.getvalue() == '<spam>eggs</spam>'
 
 
+def test_namespacer_roundtrip():
+    doc = '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:x="urn:x"><entry x:id="1"><title>A</title><x:ext></x:ext></entry></feed>'
+    root = xml.treebuilder(namespaces=True).parse(doc)
+    fp = io.StringIO()
+    writer.write(root, writer.namespacer(fp, namespaces=root.xml_namespaces))
+    assert fp.getvalue() == doc
+
+    #Elements in no namespace alongside ones in a default namespace must stay out of it
+    for doc in ('<a><b xmlns="urn:x"></b><c></c></a>', '<a xmlns="urn:x"><b xmlns=""><c xmlns="urn:x"></c></b></a>'):
+        root = xml.treebuilder(namespaces=True).parse(doc)
+        fp = io.StringIO()
+        writer.write(root, writer.namespacer(fp, namespaces=root.xml_namespaces))
+        assert fp.getvalue() == doc
+
+
 if __name__ == '__main__':
     raise SystemExit("Run with py.test")
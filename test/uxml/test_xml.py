@@ -0,0 +1,265 @@
+'''
+py.test test/uxml/test_xml.py
+'''
+
+import io
+import itertools
+import mmap
+import tempfile
+import xml.parsers.expat as expat
+
+import pytest
+from amara3.uxml import tree, xml, xmliter, parser
+
+
+DOC1 = '<a xmlns="urn:x" xmlns:p="urn:p"><p:b x="&gt;"/>t&amp;é<c k="v"><d>zz<e/></d>q</c ><d></d></a>'
+DOC2 = '<a><e><e/></e><e><e></e></e><e>x/></e></a>'
+DOC3 = '<monty><python spam="eggs">What do you mean "bleh"</python><python ministry="abuse">But I was looking for argument</python></monty>'
+
+LAZY_CASES = [DOC1, DOC2, DOC3]
+
+
+@pytest.mark.parametrize('doc', LAZY_CASES)
+def test_lazy_matches_eager(doc):
+    eager = xml.treebuilder().parse(doc)
+    lazy = xml.lazytreebuilder().parse(doc)
+    assert lazy.xml_encode() == eager.xml_encode()
+
+
+def test_lazy_materialization():
+    root = xml.lazytreebuilder().parse(DOC1)
+    c = root.xml_children[2]
+    assert c.xml_name == 'c'
+    assert c.xml_attributes == {'k': 'v'}
+    assert not c.xml_materialized
+    d = c.xml_children[0]
+    assert c.xml_materialized
+    assert not d.xml_materialized
+    assert d.xml_parent is c
+    assert d.xml_value == 'zz'
+
+
+def test_lazy_wide_encodings():
+    doc = '<?xml version="1.0" encoding="UTF-16"?>\n<a x="é"><b><c>1</c></b><d></d><e/></a>'
+    eager = xml.treebuilder().parse(doc.encode('utf-16')).xml_encode()
+    #Sniffed from the byte order mark
+    assert xml.lazytreebuilder().parse(doc.encode('utf-16')).xml_encode() == eager
+    #No byte order mark, so sniffed from the XML declaration's first bytes
+    assert xml.lazytreebuilder().parse(doc.encode('utf-16-be')).xml_encode() == eager
+    #Given explicitly
+    root = xml.lazytreebuilder().parse(doc.replace('UTF-16', 'UTF-16LE').encode('utf-16-le'), encoding='utf-16-le')
+    assert root.xml_encode() == eager
+
+
+def test_lazy_mmap():
+    with tempfile.TemporaryFile() as fp:
+        fp.write('<?xml version="1.0" encoding="iso-8859-1"?><a><b>é<c>ü</c></b></a>'.encode('latin-1'))
+        fp.flush()
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            root = xml.lazytreebuilder().parse(source)
+            assert root.xml_encode() == '<a><b>é<c>ü</c></b></a>'
+
+
+@pytest.mark.parametrize('doc', LAZY_CASES)
+def test_direct_matches_coroutine(doc):
+    expected = xml.treebuilder().parse(doc)
+    root = xml.directtreebuilder().parse(doc)
+    assert root.xml_encode() == expected.xml_encode()
+    assert root.xml_parent is None
+    for child in root.xml_children:
+        assert child.xml_parent is root
+
+
+def test_direct_pause_gc(monkeypatch):
+    import gc
+    assert gc.isenabled()
+    #Left alone by default
+    def disable():
+        raise AssertionError('gc disabled')
+    with monkeypatch.context() as m:
+        m.setattr(gc, 'disable', disable)
+        xml.directtreebuilder().parse(DOC3)
+        list(xml.directtreebuilder().parse_many([DOC3]))
+    #Only touches the process-wide gc switch when asked, & restores it
+    b = xml.directtreebuilder(pause_gc=True)
+    assert b.parse(DOC3).xml_encode() == xml.directtreebuilder().parse(DOC3).xml_encode()
+    assert gc.isenabled()
+    gc.disable()
+    try:
+        xml.directtreebuilder(pause_gc=True).parse(DOC3)
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
+
+
+@pytest.mark.parametrize('doc', LAZY_CASES)
+def test_parse_file_and_chunks(doc):
+    expected = xml.treebuilder().parse(doc).xml_encode()
+    b = xml.treebuilder()
+    assert b.parse_file(io.BytesIO(doc.encode('utf-8')), chunk_size=7).xml_encode() == expected
+    assert b.parse_file(io.StringIO(doc), chunk_size=7).xml_encode() == expected
+    frags = [ doc[i:i+5] for i in range(0, len(doc), 5) ]
+    assert b.parse_chunks(frags).xml_encode() == expected
+    events = []
+    xml.parse(io.BytesIO(doc.encode('utf-8')), xmliter.buffer_handler(events), chunk_size=3)
+    #Text may be split differently, depending on chunking
+    starts = [ ev for ev in events if ev[0] == parser.event.start_element ]
+    assert starts == [ ev for ev in parser.parse(expected) if ev and ev[0] == parser.event.start_element ]
+    assert ''.join(( ev[1] for ev in events if ev[0] == parser.event.characters )) == xml.treebuilder().parse(doc).xml_value
+
+
+def test_name_memo():
+    events = []
+    h = xml.expat_callbacks(parser.handler(events), prime_handler=False)
+    h.start_element('urn:x a', {'urn:y b': '1', 'c': '2'})
+    h.start_element('urn:x a', {})
+    h.end_element('urn:x a')
+    assert events[0][1] == 'a'
+    assert events[0][2] == {'b': '1', 'c': '2'}
+    assert events[0][1] is events[1][1] is events[2][1]
+    assert h._split('urn:x a') == ('urn:x', 'a')
+    assert h._split('c') == (None, 'c')
+
+
+NSDOC = '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:x="urn:x"><entry x:id="1" xml:lang="en"><title>A</title><x:ext a="b"/></entry><other xmlns="urn:o"><p/></other></feed>'
+
+
+def test_ns_preserving_tree():
+    root = xml.treebuilder(namespaces=True).parse(NSDOC)
+    nst = root.xml_namespaces
+    entry, other = root.xml_children
+    assert nst.uris[root.xml_nsid] == 'http://www.w3.org/2005/Atom'
+    assert entry.xml_nsid == root.xml_nsid
+    assert nst.uris[entry.xml_children[1].xml_nsid] == 'urn:x'
+    assert { k: nst.uris[v] for k, v in entry.xml_attr_nsids.items() } == {'id': 'urn:x', 'lang': xml.XML_NAMESPACE}
+    assert nst.uris[other.xml_children[0].xml_nsid] == 'urn:o'
+    assert root.xml_attr_nsids is None
+    #Plain MicroXML view is unchanged
+    assert root.xml_encode() == xml.treebuilder().parse(NSDOC).xml_encode()
+
+
+def test_ns_preserving_sender():
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e)
+
+    found = []
+    ts = xmliter.sender(('feed', '*', '*'), sink(found), callbacks=xml.ns_expat_callbacks)
+    ts.parse(NSDOC)
+    nst = ts.handler.namespaces
+    assert [ (nst.uris[e.xml_nsid], e.xml_name) for e in found ] == [
+        ('http://www.w3.org/2005/Atom', 'title'), ('urn:x', 'ext'), ('urn:o', 'p')]
+
+
+@pytest.mark.parametrize('builder', [xml.treebuilder, xml.directtreebuilder])
+def test_parse_many(builder):
+    b = builder()
+    roots = list(b.parse_many(LAZY_CASES))
+    assert [ r.xml_encode() for r in roots ] == [ xml.treebuilder().parse(doc).xml_encode() for doc in LAZY_CASES ]
+    #Still fine after a failed parse
+    with pytest.raises(expat.ExpatError):
+        b.parse('<a><b></a>')
+    assert b.parse(DOC3).xml_encode() == roots[2].xml_encode()
+
+
+def test_parse_many_namespaces():
+    b = xml.treebuilder(namespaces=True)
+    root1, root2 = b.parse_many([NSDOC, '<a xmlns="urn:a"></a>'])
+    assert root1.xml_namespaces is not root2.xml_namespaces
+    assert root2.xml_namespaces.uris[root2.xml_nsid] == 'urn:a'
+    assert root1.xml_namespaces.uris[root1.xml_nsid] == 'http://www.w3.org/2005/Atom'
+
+
+def test_parse_stream():
+    docs = ['<?xml version="1.0"?>\n' + DOC1, DOC2, DOC3]
+    stream = '\n'.join(docs).encode('utf-8')
+    chunks = [ stream[i:i+11] for i in range(0, len(stream), 11) ]
+    roots = list(xml.treebuilder().parse_stream(chunks))
+    assert [ r.xml_encode() for r in roots ] == [ xml.treebuilder().parse(doc).xml_encode() for doc in docs ]
+
+    #As for parse, the encoding declared by a document given as strings doesn't apply
+    latin1 = '<?xml version="1.0" encoding="iso-8859-1"?><a>é</a>'
+    assert [ r.xml_value for r in xml.treebuilder().parse_stream([latin1[:30], latin1[30:] + latin1]) ] == ['é', 'é']
+    assert [ r.xml_value for r in xml.treebuilder().parse_stream([latin1.encode('iso-8859-1')]) ] == ['é']
+
+    roots = list(xml.treebuilder(namespaces=True).parse_stream([NSDOC, NSDOC]))
+    assert len(roots) == 2
+    assert roots[1].xml_namespaces.uris[roots[1].xml_nsid] == 'http://www.w3.org/2005/Atom'
+
+    def sink(accumulator):
+        while True:
+            e = yield
+            accumulator.append(e.xml_value)
+
+    values = []
+    ts = xmliter.sender(('monty', 'python'), sink(values))
+    ts.parse_stream([DOC3[:20], DOC3[20:] + DOC3])
+    assert len(values) == 4
+
+
+def test_shared_values():
+    values = tree.valuetable()
+    root1 = xml.treebuilder(values=values).parse(DOC3)
+    root2 = xml.treebuilder(values=values).parse(DOC3)
+    assert root1.xml_children[0].xml_attributes['spam'] is root2.xml_children[0].xml_attributes['spam']
+    assert root1.xml_children[1].xml_name is root2.xml_children[1].xml_name
+
+
+def test_iterparse():
+    doc = '<db>' + ''.join('<record id="{0}"><v>{0}</v></record>'.format(i) for i in range(1000)) + '</db>'
+    results = [ e.xml_attributes['id'] for e in xmliter.iterparse(io.BytesIO(doc.encode('utf-8')), ('db', 'record'), chunk_size=100) ]
+    assert results == [ str(i) for i in range(1000) ]
+    results = [ e.xml_value for e in xmliter.iterparse(doc, "//record[@id='7']/v") ]
+    assert results == ['7']
+
+    #Early termination only reads as much of the input as needed
+    fp = io.BytesIO(doc.encode('utf-8'))
+    first = list(itertools.islice(xmliter.iterparse(fp, ('db', 'record'), chunk_size=100), 3))
+    assert [ e.xml_value for e in first ] == ['0', '1', '2']
+    assert fp.tell() < 500
+
+    #Field extraction, without building subtrees
+    records = xmliter.iterparse(doc, ('db', 'record'), fields={'id': '@id', 'v': 'v'})
+    assert list(itertools.islice(records, 2)) == [{'id': '0', 'v': '0'}, {'id': '1', 'v': '1'}]
+
+
+def test_async_sender():
+    import asyncio
+    import concurrent.futures
+
+    doc = '<db>' + ''.join('<record id="{0}"><v>{0}</v></record>'.format(i) for i in range(200)) + '</db>'
+    chunks = [ doc[i:i+50].encode('utf-8') for i in range(0, len(doc), 50) ]
+
+    async def run(executor=None, fail_at=None):
+        read = []
+        async def source():
+            for i, chunk in enumerate(chunks):
+                read.append(i)
+                await asyncio.sleep(0)
+                yield chunk
+        seen = []
+        async def sink(e):
+            if e.xml_value == fail_at:
+                raise ValueError(fail_at)
+            #By the time each match arrives, the parse can only have run as far ahead as the queue allows
+            seen.append((e.xml_value, len(read)))
+            await asyncio.sleep(0.001)
+        await xmliter.async_sender(('db', 'record'), sink, queue_size=4, executor=executor).parse(source())
+        return seen
+
+    seen = asyncio.run(run())
+    assert [ v for v, r in seen ] == [ str(i) for i in range(200) ]
+    #About 60 bytes per record, 50 per chunk
+    assert all( r * 50 < (int(v) + 8) * 60 for v, r in seen )
+
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        seen = asyncio.run(run(executor=executor))
+    assert [ v for v, r in seen ] == [ str(i) for i in range(200) ]
+
+    with pytest.raises(ValueError):
+        asyncio.run(run(fail_at='10'))
+
+
+if __name__ == '__main__':
+    raise SystemExit("Run with py.test")